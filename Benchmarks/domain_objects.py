@@ -0,0 +1,67 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from salabimElevator_multiprocessing import Item, Request, Tray, config
+
+''' =============== Memory and construction time of the simulation objects =============== '''
+# Builds an inventory of N units (one Item per unit, spread over the trays) and the Requests of the orders
+# containing those units, once with the __slots__ classes of the simulation and once with equivalent classes that
+# have a per-instance __dict__ (the previous implementation).
+# Usage (from the root of the project): python -m Benchmarks.domain_objects --units 100000 1000000
+
+
+class DictItem(Item):
+    pass  # a subclass without __slots__ gets a __dict__ again
+
+
+class DictRequest(Request):
+    pass
+
+
+def build(units, item_class, request_class, np_rng):
+    """ Creates the items and requests for an inventory of `units` units. Returns (trays, requests). """
+    trays = [Tray(i) for i in range(config.max_trays)]
+    codes = np_rng.integers(20000, size=units, dtype=np.int32)
+    tray_ids = np_rng.integers(len(trays), size=units)
+    for code, tray_id in zip(codes.tolist(), tray_ids.tolist()):
+        item = item_class(code)
+        item.tray_ID = tray_id
+        trays[tray_id].add_item(item)
+
+    order_sizes = np_rng.negative_binomial(1.5, 0.35, size=units) + 1
+    ends = np.cumsum(order_sizes)
+    orders = np.split(codes, ends[:np.searchsorted(ends, units)])
+    requests = [request_class(item_names=order.tolist()) for order in orders]
+    return trays, requests
+
+
+def measure(units, item_class, request_class, seed=0):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = build(units, item_class, request_class, np.random.default_rng(seed))
+    seconds = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return seconds, current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--units", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'units':>10} {'objects':>8} {'time (s)':>9} {'memory (MB)':>12} {'bytes/unit':>11}")
+    for units in args.units:
+        for name, item_class, request_class in [("dict", DictItem, DictRequest), ("slots", Item, Request)]:
+            seconds, memory = measure(units, item_class, request_class)
+            print(f"{units:>10} {name:>8} {seconds:>9.2f} {memory / 1e6:>12.1f} {memory / units:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
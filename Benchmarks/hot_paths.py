@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from salabimElevator_multiprocessing import Item, Tray, Warehouse, calculate_travel_time, config
+from Dataverwerking_code.for_main.Tray_filling import fill_trays_bin_packing, fill_trays_sequential
+from Dataverwerking_code.for_main.Picktijden import generate_picktime_samples
+from Dataverwerking_code.for_main.VerdelingBestellingen import group_all_items_into_orders
+
+''' =============== Micro-benchmarks of the simulation hot paths =============== '''
+# Times the functions that are called most often in a run, for several input sizes. Every case builds a synthetic
+# fixture with a fixed seed (no Excel files needed), so two runs of the suite measure exactly the same work.
+# Usage (from the root of the project):
+#   python -m Benchmarks.hot_paths                                   print the timings
+#   python -m Benchmarks.hot_paths --save Benchmarks/baselines/hot_paths.json
+#   python -m Benchmarks.hot_paths --compare Benchmarks/baselines/hot_paths.json --threshold 0.25
+# With --compare the exit code is 1 when a case is more than "threshold" (relative) slower than the baseline.
+# Baselines are machine specific: compare against a baseline saved on the same machine.
+
+SEED = 0
+LOOKUPS = 100  # item lookups / removals per timed call
+
+
+def item_dimensions(n, np_rng):
+    """ n synthetic items (l, w, code) between 5 cm and 60 cm, like the rows of item_dims.json. """
+    dimensions = np_rng.uniform(0.05, 0.6, size=(n, 2)).round(3)
+    return [(l, w, code) for code, (l, w) in enumerate(dimensions.tolist())]
+
+
+def filled_warehouse(units, np_rng):
+    warehouse = Warehouse(config.WAREHOUSE_HEIGHT)
+    tray_ids = np_rng.integers(len(warehouse.trays), size=units)
+    for name, tray_id in enumerate(tray_ids.tolist()):
+        warehouse.add_item(Item(name), tray_id)
+    return warehouse
+
+
+def travel_time_case(moves, np_rng):
+    levels = np_rng.integers(config.WAREHOUSE_HEIGHT, size=(moves, 2)).tolist()
+
+    def run():
+        for start, end in levels:
+            calculate_travel_time(start, end)
+    return run
+
+
+def locate_item_case(units, np_rng):
+    warehouse = filled_warehouse(units, np_rng)
+    names = np_rng.integers(units, size=LOOKUPS).tolist()
+
+    def run():
+        for name in names:
+            warehouse.locate_item(name)
+    return run
+
+
+def remove_item_case(items_per_tray, np_rng):
+    tray = Tray(0)
+    for name in range(items_per_tray):
+        tray.add_item(Item(name))
+    names = np_rng.integers(items_per_tray, size=LOOKUPS).tolist()
+
+    def run():
+        for name in names:
+            tray.add_item(tray.remove_item(name))  # put it back so every call sees the same tray size
+    return run
+
+
+def bin_packing_case(n, np_rng):
+    items = item_dimensions(n, np_rng)
+    return lambda: fill_trays_bin_packing(items, config.tray_length, config.tray_width, config.max_trays)
+
+
+def sequential_case(n, np_rng):
+    items = item_dimensions(n, np_rng)
+    return lambda: fill_trays_sequential(items, config.tray_length, config.tray_width, config.max_trays)
+
+
+def picktimes_case(n, np_rng):
+    return lambda: generate_picktime_samples(n=n, np_rng=np.random.default_rng(SEED))
+
+
+def group_orders_case(units, np_rng):
+    hours = 24
+    sim_output = {hour: np_rng.integers(20000, size=units // hours, dtype=np.int32) for hour in range(hours)}
+    return lambda: group_all_items_into_orders(sim_output, r=1.5, p=0.35, np_rng=np.random.default_rng(SEED))
+
+
+# name -> (function that builds the fixture and returns the call to time, input sizes)
+CASES = {
+    "calculate_travel_time": (travel_time_case, [1_000, 10_000]),
+    "Warehouse.locate_item": (locate_item_case, [1_000, 10_000, 100_000]),
+    "Tray.remove_item": (remove_item_case, [10, 100, 1_000]),
+    "fill_trays_bin_packing": (bin_packing_case, [100, 400]),
+    "fill_trays_sequential": (sequential_case, [50, 200]),
+    "generate_picktime_samples": (picktimes_case, [1_000, 100_000]),
+    "group_all_items_into_orders": (group_orders_case, [10_000, 1_000_000]),
+}
+
+
+def time_call(call, repeats=5, min_seconds=0.2):
+    """ Best time of one call (seconds) over `repeats` rounds. A round repeats the call until it took min_seconds. """
+    call()  # warm-up: caches (Excel, csv) and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_seconds / 10 else 2
+
+    best = elapsed / number
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def run_suite(selection=None, repeats=5):
+    """ Returns {"<case>[<size>]": seconds per call}. """
+    results = {}
+    for name, (build, sizes) in CASES.items():
+        if selection and not any(part in name for part in selection):
+            continue
+        for size in sizes:
+            key = f"{name}[{size}]"
+            results[key] = time_call(build(size, np.random.default_rng(SEED)), repeats=repeats)
+            print(f"{key:<45} {results[key] * 1e3:>12.4f} ms")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ Prints the ratio to the baseline for every case. Returns the cases that are slower than 1 + threshold. """
+    regressions = []
+    print(f"\n{'case':<45} {'baseline (ms)':>14} {'now (ms)':>12} {'ratio':>7}")
+    for key, seconds in results.items():
+        if key not in baseline:
+            print(f"{key:<45} {'-':>14} {seconds * 1e3:>12.4f}   (new)")
+            continue
+        ratio = seconds / baseline[key]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{key:<45} {baseline[key] * 1e3:>14.4f} {seconds * 1e3:>12.4f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", help="only the cases whose name contains one of these strings")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run_suite(args.cases, repeats=args.repeats)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "processor": platform.processor(), "seconds_per_call": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["seconds_per_call"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) more than {args.threshold:.0%} slower than the baseline")
+            sys.exit(1)
+        print(f"\nNo case more than {args.threshold:.0%} slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from salabimElevator_multiprocessing import initialize_result_files, run_with_config
+from salabimElevator_sweep import load_yaml
+
+''' =============== End-to-end scaling of the simulator =============== '''
+# Runs the full pipeline (orders, tray filling, picking times and the simulation) for every combination of
+# WAREHOUSE_HEIGHT, TRAYS_PER_ROW, hours and amount of worker processes, and reports the speed of the simulator:
+# - items_per_wall_second: simulated items of all runs / wall-clock time of the pool
+# - events_per_wall_second: events scheduled by the components (hold/activate) of all runs / wall-clock time of the pool
+# - simulation_events_per_second: events / time of the simulation stage, per run (the event loop itself)
+# - peak_rss_mb: largest peak RSS of a worker
+# - parallel_efficiency: items_per_wall_second / (workers * items_per_wall_second with 1 worker)
+# Every worker first does one warm-up run in the pool initializer (imports, Excel files), the clock starts when all
+# workers finished it. Then every worker does runs_per_worker runs. The stage cache is disabled and max_trays follows the size of the
+# warehouse (WAREHOUSE_HEIGHT * TRAYS_PER_ROW), so every layer of the pipeline grows with the grid.
+# Usage (from the root of the project):
+#   python -m Benchmarks.scaling --heights 50 100 200 500 --trays-per-row 1 2 --hours 1 4 12 48 --workers 1 4
+# The table is saved in main_result_output/benchmark_scaling/scaling.csv (the output of the runs is removed).
+
+OUTPUT_FOLDER = os.path.join("main_result_output", "benchmark_scaling")
+
+
+def warm_up_worker(config_dict, ready):
+    """ Pool initializer: one run outside the measurement, then tells the parent this worker is ready. """
+    run_with_config((config_dict, 0))
+    ready.put(os.getpid())
+
+
+def measure(base, height, trays_per_row, hours, workers, runs_per_worker):
+    name = f"benchmark_scaling/height={height}_trays={trays_per_row}_hours={hours}_workers={workers}"
+    config_dict = dict(base)
+    config_dict.update({
+        "name": name,
+        "WAREHOUSE_HEIGHT": height,
+        "TRAYS_PER_ROW": trays_per_row,
+        "max_trays": height * trays_per_row,
+        "hours": hours,
+        "STAGE_CACHE": False,
+        "TRACEMALLOC_RUN_INDEX": None,
+        "PROFILE_RUN_INDEX": None,
+        "COUNT_EVENTS": True,
+    })
+    initialize_result_files(name)
+
+    tasks = [(config_dict, run_index) for run_index in range(workers * runs_per_worker)]
+    ready = multiprocessing.Queue()
+    with multiprocessing.Pool(workers, initializer=warm_up_worker, initargs=(config_dict, ready)) as pool:
+        for _ in range(workers):
+            ready.get()  # wait until every worker did its warm-up run
+        start = time.perf_counter()
+        summaries = [summary for _, summary in pool.map(run_with_config, tasks, chunksize=1)]
+        wall_seconds = time.perf_counter() - start
+    shutil.rmtree(os.path.join("main_result_output", name), ignore_errors=True)
+
+    items = sum(summary["total_items"] for summary in summaries)
+    events = sum(summary["simulation_events"] for summary in summaries)
+    simulation_seconds = sum(summary["stage_seconds"]["simulation"] for summary in summaries)
+    peak_rss = [summary["peak_rss_mb"] for summary in summaries if summary.get("peak_rss_mb") is not None]
+    return {
+        "WAREHOUSE_HEIGHT": height,
+        "TRAYS_PER_ROW": trays_per_row,
+        "hours": hours,
+        "workers": workers,
+        "runs": len(summaries),
+        "items_per_run": items / len(summaries),
+        "events_per_run": events / len(summaries),
+        "wall_seconds": wall_seconds,
+        "items_per_wall_second": items / wall_seconds,
+        "events_per_wall_second": events / wall_seconds,
+        "simulation_events_per_second": events / simulation_seconds if simulation_seconds else None,
+        "peak_rss_mb": max(peak_rss) if peak_rss else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="Configurations/base.yaml")
+    parser.add_argument("--heights", type=int, nargs="+", default=[50, 100, 200, 500])
+    parser.add_argument("--trays-per-row", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--hours", type=int, nargs="+", default=[1, 4, 12, 48])
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count()}))
+    parser.add_argument("--runs-per-worker", type=int, default=2)
+    args = parser.parse_args()
+
+    base = load_yaml(args.config)
+    rows = []
+    for height, trays_per_row, hours, workers in itertools.product(args.heights, args.trays_per_row, args.hours,
+                                                                    args.workers):
+        row = measure(base, height, trays_per_row, hours, workers, args.runs_per_worker)
+        rows.append(row)
+        print(f"height={height} trays_per_row={trays_per_row} hours={hours} workers={workers}: "
+              f"{row['items_per_wall_second']:.1f} items/s, {row['events_per_wall_second']:.0f} events/s, "
+              f"peak RSS {row['peak_rss_mb']} MB")
+
+    table = pd.DataFrame(rows)
+    single_worker = table[table["workers"] == 1].set_index(["WAREHOUSE_HEIGHT", "TRAYS_PER_ROW", "hours"])
+    table["parallel_efficiency"] = [
+        row.items_per_wall_second / (row.workers * single_worker.loc[key, "items_per_wall_second"])
+        if key in single_worker.index else None
+        for key, row in zip(zip(table["WAREHOUSE_HEIGHT"], table["TRAYS_PER_ROW"], table["hours"]),
+                            table.itertuples())
+    ]
+
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    table_path = os.path.join(OUTPUT_FOLDER, "scaling.csv")
+    table.to_csv(table_path, index=False)
+    print(table.to_string(index=False))
+    print(f"Scaling table saved to {table_path}")
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")  # Required on Windows
+    main()
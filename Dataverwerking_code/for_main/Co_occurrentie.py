@@ -0,0 +1,128 @@
+import functools
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+USE_PRINT = True
+
+def debug_print(*args, **kwargs):
+    # use this instead of "print". it automatically checks if USE_PRINT is set or not
+    if USE_PRINT:
+        print(*args, **kwargs)
+
+HISTORICAL_ORDERS_PATH = 'Dataverwerking_code/Dataverwerking_data_output/grouped_orders.csv'
+
+
+def load_grouped_orders(filename):
+    """
+    Leest bestellingen in zoals weggeschreven door save_grouped_orders_flat.
+
+    Returns:
+    - lijst van bestellingen (elke bestelling is een lijst van itemcodes als strings)
+    """
+    df = pd.read_csv(filename, dtype={"items": str})
+    return [items.split(",") for items in df["items"].dropna()]
+
+
+def build_co_occurrence_matrix(grouped_orders):
+    """
+    Bouwt een sparse SKU x SKU matrix met hoe vaak twee SKU's in dezelfde bestelling zitten.
+    Via de incidentiematrix B (bestelling x SKU) is dat B^T B, de diagonaal wordt op 0 gezet.
+
+    Parameters:
+    - grouped_orders: lijst van bestellingen (lijsten van itemcodes)
+
+    Returns:
+    - co_matrix: scipy.sparse csr_matrix (int32) met de co-occurrence tellingen
+    - vocab: dict van itemcode (str) -> rij/kolom index in co_matrix
+    """
+    vocab = {}
+    rows = []
+    cols = []
+    for order_index, order in enumerate(grouped_orders):
+        for code in set(str(code) for code in order):
+            rows.append(order_index)
+            cols.append(vocab.setdefault(code, len(vocab)))
+
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(len(grouped_orders), len(vocab))
+    )
+    co_matrix = (incidence.T @ incidence).tocsr()
+    co_matrix.setdiag(0)
+    co_matrix.eliminate_zeros()
+    return co_matrix, vocab
+
+
+@functools.lru_cache(maxsize=None)
+def load_historical_co_occurrence(filename=HISTORICAL_ORDERS_PATH):
+    """ Co-occurrence van de historische bestellingen, één keer per proces ingelezen. """
+    return build_co_occurrence_matrix(load_grouped_orders(filename))
+
+
+def sku_tray_map(tray_items):
+    """
+    Geeft per itemcode de eerste tray (laagste tray index) waarin het item ligt,
+    net zoals Warehouse.locate_item in de simulatie zoekt.
+    """
+    first_tray = {}
+    for tray_index in sorted(tray_items):
+        for item in tray_items[tray_index]:
+            first_tray.setdefault(item["item_id"], tray_index)
+    return first_tray
+
+
+def expected_tray_retrievals(grouped_orders, tray_items):
+    """
+    Verwacht aantal tray-ophalingen per bestelling: het aantal verschillende trays waar de items van een bestelling
+    liggen. De operator neemt alle items van de bestelling die op dezelfde tray liggen in één keer.
+    Het leegraken van trays tijdens de simulatie wordt niet meegerekend.
+    De itemcodes van de bestellingen en de trays moeten van hetzelfde soort zijn (tekst of SkuVocabulary-indices).
+    """
+    first_tray = sku_tray_map(tray_items)
+    total = 0
+    amount_of_orders = 0  # grouped_orders kan ook een generator zijn
+    for order in grouped_orders:
+        codes = order.tolist() if isinstance(order, np.ndarray) else order
+        total += len({first_tray[code] for code in codes if code in first_tray})
+        amount_of_orders += 1
+    return total / amount_of_orders if amount_of_orders else 0.0
+
+
+def report_tray_retrievals(grouped_orders, before_tray_items, after_tray_items):
+    """
+    Print het verwachte aantal tray-ophalingen per bestelling voor en na een (affiniteits)vulling.
+
+    Returns:
+    - (voor, na)
+    """
+    before = expected_tray_retrievals(grouped_orders, before_tray_items)
+    after = expected_tray_retrievals(grouped_orders, after_tray_items)
+    change = (after - before) / before * 100 if before else 0.0
+    debug_print(f"📦 Verwachte tray-ophalingen per bestelling: voor {before:.3f} → na {after:.3f} ({change:+.1f}%)")
+    return before, after
+
+
+def main():
+    # Vergelijk bin packing met de affiniteitsvulling op de opgeslagen data (uitvoeren vanuit de root van het project)
+    from Dataverwerking_code.for_main.Tray_filling import (
+        load_saved_item_dimensions, load_ordered_items, get_ordered_item_dimensions,
+        fill_trays_bin_packing, fill_trays_by_affinity
+    )
+
+    output_folder = 'Dataverwerking_code/Dataverwerking_data_output'
+    dimensions = load_saved_item_dimensions(f'{output_folder}/item_dims.json')
+    items = get_ordered_item_dimensions(load_ordered_items(f'{output_folder}/augmented_output.csv'), dimensions)
+    grouped_orders = load_grouped_orders(HISTORICAL_ORDERS_PATH)
+    co_matrix, vocab = load_historical_co_occurrence()
+
+    tray_length, tray_width, max_trays = 2.025, 1.323, 100
+    before, _ = fill_trays_bin_packing(items, tray_length, tray_width, max_trays)
+    after, _ = fill_trays_by_affinity(items, co_matrix, vocab, tray_length, tray_width, max_trays)
+    report_tray_retrievals(grouped_orders, before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 
 import numpy as np
 from numpy.random import default_rng
@@ -79,12 +80,16 @@ def sample_globale_picktijd(n=1, np_rng=None):
         picktijden.append(sample)
     return picktijden
 
-def generate_picktime_samples(n=1000, data_folder='Dataverwerking_code/PicktijdenBerekening_IQR', np_rng=None):
+@lru_cache(maxsize=None)
+def fit_picktime_distributions(data_folder='Dataverwerking_code/PicktijdenBerekening_IQR'):
     """
-    Gebruikt om op te roepen in een ander script
-    """
-    np_rng = np_rng or np.random.default_rng()
+    Past per user een lognormale verdeling op de picktijden (users met minstens 10 metingen).
+    Eén keer per proces per map, daarna uit de cache.
 
+    Returns:
+    - verdelingen: tuple van (shape, loc, scale) per user
+    - gewichten: tuple met het aandeel van elke user in alle metingen (som 1)
+    """
     alle_df = []
     for bestand in os.listdir(data_folder):
         if bestand.endswith('_picktijden_IQR.csv'):
@@ -112,6 +117,41 @@ def generate_picktime_samples(n=1000, data_folder='Dataverwerking_code/Picktijde
 
     gewichten = np.array(gewichten)
     gewichten /= gewichten.sum()
+    return tuple(verdelingen), tuple(gewichten.tolist())
+
+
+def picktime_mean(data_folder='Dataverwerking_code/PicktijdenBerekening_IQR'):
+    """ Verwachte picktijd (sec): het gewogen gemiddelde van de lognormale verdelingen van de users. """
+    verdelingen, gewichten = fit_picktime_distributions(data_folder)
+    return sum(gewicht * lognorm.mean(shape, loc=loc, scale=scale)
+               for (shape, loc, scale), gewicht in zip(verdelingen, gewichten))
+
+
+def generate_picktime_samples(n=1000, data_folder='Dataverwerking_code/PicktijdenBerekening_IQR', np_rng=None, antithetic=None):
+    """
+    Gebruikt om op te roepen in een ander script
+
+    antithetic: None  -> standaard sampling (user kiezen, dan lognorm.rvs)
+                False -> inverse transformatie met uniforme getallen U
+                True  -> inverse transformatie met 1 - U (antithetische tegenhanger van False met dezelfde np_rng)
+    """
+    np_rng = np_rng or np.random.default_rng()
+
+    verdelingen, gewichten = fit_picktime_distributions(data_folder)
+    verdelingen = list(verdelingen)
+    gewichten = np.array(gewichten)
+
+    if antithetic is not None:
+        # Inverse transformatie: U kiest de user (cumulatieve gewichten) en de picktijd (lognormale quantiel)
+        uniform = np_rng.random((n, 2))
+        if antithetic:
+            uniform = 1.0 - uniform
+        params = np.array(verdelingen)
+        gekozen = np.minimum(np.searchsorted(np.cumsum(gewichten), uniform[:, 0], side="right"), len(verdelingen) - 1)
+        # 1 - U kan exact 1 worden, wat een oneindige picktijd zou geven
+        kans = np.clip(uniform[:, 1], np.finfo(float).tiny, 1.0 - np.finfo(float).eps)
+        samples = lognorm.ppf(kans, params[gekozen, 0], loc=params[gekozen, 1], scale=params[gekozen, 2])
+        return samples.tolist()
 
     # Sampling
     picktijden = []
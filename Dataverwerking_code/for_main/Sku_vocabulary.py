@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def normalize_sku(code):
+    """ Itemcode als tekst zoals in item_dims.json: 7904, 7904.0 en "7904" worden allemaal "7904". """
+    try:
+        return str(int(float(code)))
+    except (TypeError, ValueError):
+        return str(code).strip()
+
+
+class SkuVocabulary:
+    """
+    Vaste nummering van alle itemcodes: elke code krijgt een int32 index (0..n-1).
+    In de pijplijn (bestellingen, trays, simulatie) worden enkel die indices gebruikt,
+    de codes als tekst worden pas teruggezet (decode) bij het wegschrijven van resultaten.
+    """
+    def __init__(self, codes):
+        self.codes = [normalize_sku(code) for code in codes]
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        if len(self.index) != len(self.codes):
+            raise ValueError("Een itemcode komt meerdere keren voor in de vocabulary")
+
+    def __len__(self):
+        return len(self.codes)
+
+    def encode(self, codes):
+        """ Lijst van itemcodes -> numpy array (int32) van indices. Onbekende codes geven een KeyError. """
+        return np.fromiter((self.index[normalize_sku(code)] for code in codes), dtype=np.int32, count=len(codes))
+
+    def decode(self, indices):
+        """ Indices -> lijst van itemcodes (str). """
+        return [self.codes[i] for i in np.asarray(indices).tolist()]
+
+    def decode_one(self, index):
+        return self.codes[index]
+
+    def encode_mapping(self, mapping):
+        """ dict van itemcode -> waarde naar dict van index -> waarde (codes buiten de vocabulary vallen weg). """
+        encoded = {}
+        for code, value in mapping.items():
+            index = self.index.get(normalize_sku(code))
+            if index is not None:
+                encoded[index] = value
+        return encoded
@@ -0,0 +1,123 @@
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+
+
+USE_PRINT = False
+
+def debug_print(*args, **kwargs):
+    # use this instead of "print". it automatically checks if USE_PRINT is set or not
+    if USE_PRINT:
+        print(*args, **kwargs)
+
+
+def file_fingerprint(*patterns):
+    """
+    Fingerprint of input files (path, size, modification time) so a cache entry is invalidated when they change.
+    Accepts paths or glob patterns.
+    """
+    paths = sorted(path for pattern in patterns for path in glob.glob(pattern))
+    return [(path, os.path.getsize(path), os.stat(path).st_mtime_ns) for path in paths]
+
+
+def rng_state(generators):
+    """ State of random.Random and/or numpy Generator objects, used in cache keys and restored on a cache hit. """
+    return [
+        generator.getstate() if hasattr(generator, "getstate") else generator.bit_generator.state
+        for generator in generators
+    ]
+
+
+def set_rng_state(states, generators):
+    for generator, state in zip(generators, states):
+        if hasattr(generator, "setstate"):
+            generator.setstate(state)
+        else:
+            generator.bit_generator.state = state
+
+
+class StageCache:
+    """
+    Content-addressed cache for the output of a deterministic pipeline stage.
+    The key is a hash of the stage name, its inputs and the state of the random generators it uses.
+    Entries are zlib-compressed pickles. When the folder grows beyond max_bytes, the least recently used entries
+    (oldest modification time, a hit touches the file) are removed.
+    """
+    def __init__(self, folder, max_bytes=2 * 1024 ** 3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, stage, *parts):
+        digest = hashlib.sha256(pickle.dumps((stage, parts), protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+        return f"{stage}-{digest}"
+
+    def path(self, key):
+        return os.path.join(self.folder, f"{key}.bin")
+
+    def load(self, key):
+        """ Returns (True, value) on a hit and (False, None) on a miss. """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except Exception:
+            # Missing, truncated, corrupt or incompatible (e.g. written by another version of the code): a miss,
+            # the stage is computed again and the entry is overwritten
+            return False, None
+        os.utime(path)  # mark as recently used
+        return True, value
+
+    def store(self, key, value):
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        # Write to a temporary file first so other workers never read a half written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.folder, "*.bin")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # removed by another worker
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def run(self, stage, key_parts, compute, generators=()):
+        """
+        Returns the cached output of a stage, or computes and stores it.
+        The random generators (random.Random or numpy Generator) used by the stage are part of the key and their
+        state after the stage is stored with the output, so later draws are the same whether the stage was loaded
+        or computed.
+        """
+        key = self.key(stage, key_parts, rng_state(generators))
+        hit, value = self.load(key)
+        if hit:
+            self.hits += 1
+            output, state_after = value
+            set_rng_state(state_after, generators)
+            debug_print(f"Stage cache hit: {stage}")
+            return output
+
+        self.misses += 1
+        output = compute()
+        self.store(key, (output, rng_state(generators)))
+        return output
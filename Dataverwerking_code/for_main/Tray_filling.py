@@ -1,15 +1,23 @@
+import functools
 import json
 import random
+import time
 from collections import Counter
 from pathlib import Path
-from rectpack import newPacker, MaxRectsBaf
+from rectpack import newPacker, MaxRectsBaf, PackingMode, PackingBin
+from rectpack.geometry import Rectangle
+import numpy as np
 import pandas as pd
 
+from Dataverwerking_code.for_main.Co_occurrentie import load_historical_co_occurrence
+
 # from Dataverwerking_code.Preprocessing import load_simulation
 
 
 USE_PRINT = True
 
+ITEM_DIMENSIONS_PATH = 'Dataverwerking_code/Dataverwerking_data_output/item_dims.json'
+
 def debug_print(*args, **kwargs):
     # use this instead of "print". it automatically checks if USE_PRINT is set or not
     if USE_PRINT:
@@ -51,6 +59,26 @@ def load_item_dimensions(file_path):
     return {str(int(float(k))): (float(v[0]), float(v[1])) for k, v in raw_data.items()}
 
 
+@functools.lru_cache(maxsize=None)
+def load_encoded_item_dimensions(vocabulary, file_path=ITEM_DIMENSIONS_PATH):
+    """
+    Afmetingen per geïndexeerde itemcode (zie SkuVocabulary), één keer per proces opgebouwd.
+    Codes zonder afmeting krijgen de gemiddelde dimensie van het bestand, zoals in get_ordered_item_dimensions.
+
+    Returns:
+    - dict van index -> (lengte, breedte) voor elke code in de vocabulary
+    """
+    loaded = load_saved_item_dimensions(file_path)
+    avg_l = sum(dims[0] for dims in loaded.values()) / len(loaded)
+    avg_w = sum(dims[1] for dims in loaded.values()) / len(loaded)
+
+    dimensions = vocabulary.encode_mapping(loaded)
+    missing = len(vocabulary) - len(dimensions)
+    if missing:
+        debug_print(f"⚠️ Waarschuwing: {missing} item(s) hadden geen dimensie. Gemiddelde dimensies gebruikt.")
+    return {index: dimensions.get(index, (avg_l, avg_w)) for index in range(len(vocabulary))}
+
+
 def load_ordered_items(filename):
     # lees CSV en groepeer terug naar dict {date: [item_codes]}
     df = pd.read_csv(filename, parse_dates=["date"])
@@ -131,16 +159,16 @@ def fill_trays_bin_packing(items, tray_length, tray_width, max_trays, allow_rota
 def fill_trays_sequential(items, tray_length, tray_width, max_trays):
     """
     Plaatst items sequentieel in trays zonder sortering.
-    Tray indices starten vanaf 1.
+    Tray indices starten vanaf 0, net zoals de trays van het magazijn in de simulatie.
 
     Parameters:
     - items: lijst van (l, w, item_id) tuples
 
     Returns:
-    - tray_items: dict van tray_index (1-based) -> geplaatste items (met x, y)
+    - tray_items: dict van tray_index (0-based) -> geplaatste items (met x, y)
     - not_placed: lijst van niet-geplaatste item-ID's
     """
-    tray_items = {i: [] for i in range(1, max_trays + 1)}
+    tray_items = {i: [] for i in range(max_trays)}
     not_placed = []
 
     def fits(x, y, l, w, placed, tray_l, tray_w):
@@ -166,10 +194,10 @@ def fill_trays_sequential(items, tray_length, tray_width, max_trays):
             y += step
         return None
 
-    tray_index = 1
+    tray_index = 0
     for l_orig, w_orig, item_id in items:
         placed = False
-        while tray_index <= max_trays:
+        while tray_index < max_trays:
             for l, w in [(l_orig, w_orig), (w_orig, l_orig)]:
                 position = find_position(l, w, tray_items[tray_index], tray_length, tray_width)
                 if position:
@@ -194,19 +222,20 @@ def fill_trays_sequential(items, tray_length, tray_width, max_trays):
     return tray_items, not_placed
 
 
-def fill_trays_random_best_fit(items, tray_length, tray_width, max_trays):
+def fill_trays_random_best_fit(items, tray_length, tray_width, max_trays, rng=None):
     """
     Plaatst items in trays met random volgorde van items en trays,
     en kiest per tray de best mogelijke plek (laagste y).
 
-    Tray indices starten vanaf 1.
+    Tray indices starten vanaf 0, net zoals de trays van het magazijn in de simulatie.
     items: lijst van (l, w, item_id) tuples
+    rng: random.Random om reproduceerbaar te vullen (standaard de globale random module)
 
     Returns:
-    - tray_items: dict van tray_index (1-based) -> geplaatste items met x/y/l/w
+    - tray_items: dict van tray_index (0-based) -> geplaatste items met x/y/l/w
     - not_placed: lijst van item-ID's die niet geplaatst konden worden
     """
-    tray_items = {i: [] for i in range(1, max_trays + 1)}
+    tray_items = {i: [] for i in range(max_trays)}
     not_placed = []
 
     def fits(x, y, l, w, placed, tray_l, tray_w):
@@ -236,14 +265,16 @@ def fill_trays_random_best_fit(items, tray_length, tray_width, max_trays):
             y += step
         return best
 
+    rng = rng if rng is not None else random
+
     # Shuffle the list of items
     shuffled_items = items[:]
-    random.shuffle(shuffled_items)
+    rng.shuffle(shuffled_items)
 
     for orig_l, orig_w, item_id in shuffled_items:
         placed = False
-        tray_order = list(range(1, max_trays + 1))
-        random.shuffle(tray_order)
+        tray_order = list(range(max_trays))
+        rng.shuffle(tray_order)
 
         for tray in tray_order:
             for l, w in [(orig_l, orig_w), (orig_w, orig_l)]:  # probeer rotatie
@@ -268,9 +299,84 @@ def fill_trays_random_best_fit(items, tray_length, tray_width, max_trays):
     return tray_items, not_placed
 
 
+def score_tray_filling(tray_items, not_placed, objective, tray_length, tray_width, trays_per_row=2, operator_level=0):
+    """
+    Geeft een score (lager = beter) voor een tray-indeling.
+    Niet-geplaatste items wegen altijd het zwaarst, daarna telt het gekozen objectief.
+
+    Parameters:
+    - objective: "trays"  -> aantal gebruikte trays
+                 "unused" -> ongebruikte ruimte (m²) in de gebruikte trays (via calculate_unused_space)
+                 "travel" -> verwachte liftverplaatsing (niveaus heen en terug) per item
+    - trays_per_row, operator_level: nodig om een tray-index om te zetten naar een niveau
+
+    Returns:
+    - tuple (aantal niet-geplaatste items, objectiefwaarde)
+    """
+    used_trays = {tray: items for tray, items in tray_items.items() if items}
+
+    if objective == "trays":
+        value = len(used_trays)
+    elif objective == "unused":
+        _, value = calculate_unused_space(used_trays, tray_length, tray_width)
+    elif objective == "travel":
+        # Zelfde niveau-indeling als de Tray klasse in de simulatie
+        total_levels = 0
+        amount_of_items = 0
+        for tray, items in used_trays.items():
+            level = (tray - 1) // 2 if trays_per_row == 2 else tray
+            total_levels += 2 * abs(level - operator_level) * len(items)
+            amount_of_items += len(items)
+        value = total_levels / amount_of_items if amount_of_items else 0.0
+    else:
+        raise ValueError(f"Onbekend objectief voor multi-start: {objective}")
+
+    return len(not_placed), value
+
+
+def fill_trays_random_multistart(items, tray_length, tray_width, max_trays, starts=8, seed=0, objective="trays",
+                                 time_budget=None, trays_per_row=2, operator_level=0):
+    """
+    Voert fill_trays_random_best_fit 'starts' keer uit met de seeds seed, seed+1, ...
+    en houdt de beste indeling volgens het objectief (zie score_tray_filling).
+
+    De starts lopen na elkaar in het huidige proces: de tray filling draait in een worker van de simulatie-pool
+    (daemon proces), die zelf geen pool mag starten. Meerdere runs vullen wel tegelijk hun trays.
+    Met time_budget (seconden) worden er geen nieuwe starts meer gedaan zodra het budget op is, de beste van de
+    afgewerkte starts wordt dan teruggegeven.
+    Bij gelijke score wint de laagste seed, zodat het resultaat reproduceerbaar is.
+
+    Returns:
+    - tray_items, not_placed van de beste start (zelfde formaat als fill_trays_random_best_fit)
+    """
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+
+    best = None
+    for start_seed in range(seed, seed + starts):
+        tray_items, not_placed = fill_trays_random_best_fit(items, tray_length, tray_width, max_trays,
+                                                            rng=random.Random(start_seed))
+        out_of_bounds, overlaps = find_tray_violations(tray_items, tray_length, tray_width, tray_count=max_trays)
+        if out_of_bounds or overlaps:
+            # Een ongeldige indeling mag nooit gekozen worden
+            debug_print(f"⚠️ Multi-start seed {start_seed} gaf een ongeldige indeling en wordt genegeerd.")
+        else:
+            score = score_tray_filling(tray_items, not_placed, objective, tray_length, tray_width, trays_per_row,
+                                       operator_level)
+            if best is None or (score, start_seed) < (best[1], best[0]):
+                best = (start_seed, score, tray_items, not_placed)
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+
+    if best is None:
+        raise Exception("Multi-start vond geen geldige tray-indeling")
+
+    debug_print(f"Multi-start: beste seed {best[0]} met score {best[1]} ({objective})")
+    return best[2], best[3]
+
+
 def fill_trays_by_frequency(ordered_item_codes, all_dimensions, tray_length, tray_width, max_trays):
     """
-    Plaatst items met de hoogste frequentie in de laagste trays (1,2,3,...)
+    Plaatst items met de hoogste frequentie in de laagste trays (0,1,2,...)
 
     Parameters:
     - ordered_item_codes: lijst van item_codes als strings
@@ -279,10 +385,10 @@ def fill_trays_by_frequency(ordered_item_codes, all_dimensions, tray_length, tra
     - max_trays: aantal trays
 
     Returns:
-    - tray_items: dict van tray_index (1-based) -> geplaatste items
+    - tray_items: dict van tray_index (0-based) -> geplaatste items
     - not_placed: lijst van item_codes die niet geplaatst konden worden
     """
-    tray_items = {i: [] for i in range(1, max_trays + 1)}
+    tray_items = {i: [] for i in range(max_trays)}
     not_placed = []
 
     def fits(x, y, l, w, placed, tray_l, tray_w):
@@ -328,7 +434,7 @@ def fill_trays_by_frequency(ordered_item_codes, all_dimensions, tray_length, tra
         count = freq_table[code]
         for _ in range(count):
             placed = False
-            for tray_index in range(1, max_trays + 1):
+            for tray_index in range(max_trays):
                 for l, w in [(l_orig, w_orig), (w_orig, l_orig)]:
                     pos = find_best_position(l, w, tray_items[tray_index], tray_length, tray_width)
                     if pos:
@@ -350,6 +456,253 @@ def fill_trays_by_frequency(ordered_item_codes, all_dimensions, tray_length, tra
     return tray_items, not_placed
 
 
+def fill_trays_by_affinity(items, co_matrix, vocab, tray_length, tray_width, max_trays):
+    """
+    Plaatst SKU's die vaak samen besteld worden bij elkaar.
+    Eerst wordt een volgorde van de SKU's bepaald: de volgende SKU is telkens die met de hoogste co-occurrence met de
+    SKU's die al gekozen zijn, zonder verwante SKU's volgt de meest voorradige SKU.
+    Daarna wordt eerst één eenheid van elke SKU in die volgorde geplaatst en pas dan de overige eenheden, telkens in
+    de tray waar ze het best passen (best fit). Zo liggen van alle SKU's een eenheid in de laagste trays, de tray
+    die Warehouse.locate_item als eerste vindt.
+    Op de bestellingen van het model (items onafhankelijk getrokken) komt de winst t.o.v. fill_trays_bin_packing
+    van die eerste eenheden, de co-occurrence speelt pas mee als bestellingen echt samenhangen.
+    Tray indices starten vanaf 0, net zoals bij fill_trays_bin_packing.
+
+    Parameters:
+    - items: lijst van (l, w, item_id) tuples
+    - co_matrix, vocab: resultaat van build_co_occurrence_matrix (historische bestellingen),
+      de sleutels van vocab hebben hetzelfde type als de item_id's (zie SkuVocabulary.encode_mapping)
+
+    Returns:
+    - tray_items: dict van tray_index (0-based) -> geplaatste items met x/y/l/w
+    - not_placed: lijst van item-ID's die niet geplaatst konden worden
+    """
+    padding = 0.02
+    packer = newPacker(mode=PackingMode.Online, bin_algo=PackingBin.BBF, rotation=True)
+    for _ in range(max_trays):
+        packer.add_bin(tray_length, tray_width)
+
+    # Eenheden per SKU, de meest voorradige SKU's eerst als startpunt
+    units = {}
+    for l, w, code in items:
+        units.setdefault(code, []).append((l, w))
+    codes = sorted(units, key=lambda code: (-len(units[code]), str(code)))
+
+    # Co-occurrence beperkt tot de SKU's in de voorraad (SKU's zonder historiek hebben geen affiniteit)
+    known = np.array([i for i, code in enumerate(codes) if code in vocab], dtype=np.int64)
+    local = np.array([vocab[codes[i]] for i in known], dtype=np.int64)
+    affinity = co_matrix[local][:, local].tocsr()
+    rows = {int(i): k for k, i in enumerate(known)}
+
+    def affinity_row(index):
+        row = np.zeros(len(codes))
+        if index in rows:
+            start, end = affinity.indptr[rows[index]], affinity.indptr[rows[index] + 1]
+            row[known[affinity.indices[start:end]]] = affinity.data[start:end]
+        return row
+
+    # Volgorde van de SKU's op basis van affiniteit
+    remaining = np.ones(len(codes), dtype=bool)
+    scores = np.zeros(len(codes))
+    sequence = []
+    next_seed = 0
+    for _ in range(len(codes)):
+        masked = np.where(remaining, scores, -1.0)
+        index = int(masked.argmax())
+        if masked[index] <= 0:
+            while not remaining[next_seed]:
+                next_seed += 1
+            index = next_seed
+        remaining[index] = False
+        sequence.append(codes[index])
+        scores = scores + affinity_row(index)
+
+    # Eerst één eenheid per SKU, dan de rest
+    placement_order = [(code, units[code][0]) for code in sequence]
+    placement_order += [(code, dims) for code in sequence for dims in units[code][1:]]
+
+    tray_items = {i: [] for i in range(0, max_trays)}
+    not_placed = []
+    for code, (l, w) in placement_order:
+        if not ((l + padding <= tray_length and w + padding <= tray_width) or
+                (w + padding <= tray_length and l + padding <= tray_width)):
+            not_placed.append(code)  # past in geen enkele tray
+            continue
+        if packer.add_rect(l + padding, w + padding, rid=code) is None:
+            not_placed.append(code)
+
+    for tray_index, x, y, l, w, code in packer.rect_list():
+        tray_items[tray_index].append({
+            "item_id": code,
+            "item_code": code,
+            "x": x,
+            "y": y,
+            "l": l - padding,
+            "w": w - padding
+        })
+
+    return tray_items, not_placed
+
+
+def inventory_delta(previous_codes, new_codes):
+    """
+    Verschil tussen twee voorraden (lijsten van itemcodes, één per eenheid).
+
+    Returns:
+    - added: Counter van itemcode -> aantal extra eenheden
+    - removed: Counter van itemcode -> aantal eenheden die weg moeten
+    """
+    previous = Counter(previous_codes)
+    new = Counter(new_codes)
+    return new - previous, previous - new
+
+
+class TrayFreeSpace(MaxRectsBaf):
+    """
+    MaxRects packer (rectpack, best area fit) voor één tray waarin al items liggen.
+    De vrije ruimte wordt bijgehouden als maximale vrije rechthoeken: elk geplaatst item splitst de vrije
+    rechthoeken die het raakt. rectpack vergelijkt daarna alle paren rechthoeken om de overbodige te verwijderen,
+    hier enkel de nieuwe rechthoeken uit de splitsing: de andere waren al maximaal en kunnen niet in een deel van een
+    weggevallen rechthoek liggen. Met n items in de tray kost een nieuw item zo O(n) i.p.v. O(n²).
+    padding: extra ruimte rond elk item (net zoals fill_trays_bin_packing), geplaatste items nemen
+    l + padding bij w + padding in, nieuwe items worden met add_rect(l + padding, w + padding) geplaatst.
+    """
+    def __init__(self, placed, tray_l, tray_w, padding=0.0):
+        super().__init__(tray_l, tray_w, rot=True)
+        for item in placed:
+            self._split(Rectangle(item['x'], item['y'], item['l'] + padding, item['w'] + padding))
+
+    def _split(self, rect):
+        kept = []
+        new = []
+        for max_rect in self._max_rects:
+            if max_rect.intersects(rect):
+                new.extend(self._generate_splits(max_rect, rect))
+            else:
+                kept.append(max_rect)
+        # Een nieuwe rechthoek valt weg als hij in een andere ligt (bij gelijke rechthoeken blijft de eerste)
+        new = [m for i, m in enumerate(new)
+               if not any(other.contains(m) for other in kept)
+               and not any(other.contains(m) and (other != m or j < i) for j, other in enumerate(new) if j != i)]
+        self._max_rects = kept + new
+
+    def _remove_duplicates(self):
+        pass  # al gedaan in _split
+
+
+def repack_incremental(tray_items, added, removed, dimensions, tray_length, tray_width,
+                       fragmentation_threshold=0.35):
+    """
+    Past een bestaande tray-indeling aan voor een gewijzigde voorraad zonder alles opnieuw te vullen.
+    Enkel trays waaruit eenheden verdwijnen of waarin nieuwe eenheden komen worden aangepast.
+    Nieuwe eenheden gaan eerst naar trays waar dezelfde itemcode al ligt, daarna naar de eerste tray met plaats.
+
+    Nieuwe eenheden krijgen dezelfde padding als bij fill_trays_bin_packing, zodat de indeling niet dichter
+    gepakt is dan bij een volledige herverdeling.
+
+    Als niet alles geplaatst kan worden, of de fragmentatie (ongebruikte ruimte in gebruikte trays / oppervlakte van
+    de gebruikte trays) boven fragmentation_threshold komt, wordt de volledige voorraad opnieuw gevuld met
+    fill_trays_bin_packing.
+
+    Kost: de vrije ruimte van een kandidaat-tray wordt één keer opgebouwd (TrayFreeSpace), daarna kost elke
+    nieuwe eenheid O(n) voor n items in de tray (zie INCREMENTAL_REPACKING in Configurations/base.yaml).
+
+    Parameters:
+    - tray_items: bestaande indeling, dict van tray_index -> geplaatste items (wordt niet aangepast)
+    - added, removed: Counter van itemcode -> aantal eenheden (zie inventory_delta)
+    - dimensions: dict van itemcode -> (l, w), ontbrekende codes krijgen de gemiddelde dimensie
+
+    Returns:
+    - tray_items: de nieuwe indeling
+    - info: dict met touched_trays, full_repack, fragmentation en not_placed (itemcodes die ook na een volledige
+      herverdeling niet pasten)
+    """
+    padding = 0.02
+    new_trays = dict(tray_items)  # Enkel aangeraakte trays krijgen een nieuwe lijst
+    touched = set()
+
+    def touch(tray):
+        if tray not in touched:
+            new_trays[tray] = list(new_trays[tray])
+            touched.add(tray)
+        return new_trays[tray]
+
+    locations = {}
+    for tray in sorted(tray_items):
+        for item in tray_items[tray]:
+            locations.setdefault(item["item_id"], []).append(tray)
+
+    # 1. Eenheden verwijderen, achteraan beginnen zodat de eerste trays (die de lift eerst vindt) blijven staan
+    for code, amount in removed.items():
+        for tray in reversed(sorted(set(locations.get(code, [])))):
+            if amount == 0:
+                break
+            items = touch(tray)
+            for i in range(len(items) - 1, -1, -1):
+                if amount > 0 and items[i]["item_id"] == code:
+                    del items[i]
+                    locations[code].remove(tray)  # nieuwe eenheden van deze code mogen hier niet meer op rekenen
+                    amount -= 1
+
+    # 2. Eenheden toevoegen
+    tray_area = tray_length * tray_width
+    free_area = {tray: tray_area - sum((item["l"] + padding) * (item["w"] + padding) for item in items)
+                 for tray, items in new_trays.items()}
+    free_space = {}  # tray -> TrayFreeSpace, pas opgebouwd als er een item in moet
+    ordered_item_codes = [code for code, amount in added.items() for _ in range(amount)]
+    failed = {tray: [] for tray in new_trays}  # (kort, lang) van items die niet meer in de tray pasten
+    not_placed = []
+    for l_orig, w_orig, code in get_ordered_item_dimensions(ordered_item_codes, dimensions):
+        own_trays = sorted(set(locations.get(code, [])))
+        candidates = own_trays + [tray for tray in sorted(new_trays) if tray not in own_trays]
+        short, long = min(l_orig, w_orig), max(l_orig, w_orig)
+        placed = False
+        for tray in candidates:
+            if free_area[tray] < (l_orig + padding) * (w_orig + padding):
+                continue
+            # Een tray vult enkel verder op: als een kleiner item er niet meer in paste, past dit item ook niet
+            if any(short >= f_short and long >= f_long for f_short, f_long in failed[tray]):
+                continue
+            if tray not in free_space:
+                free_space[tray] = TrayFreeSpace(new_trays[tray], tray_length, tray_width, padding)
+            rect = free_space[tray].add_rect(l_orig + padding, w_orig + padding)
+            if rect is None:
+                failed[tray].append((short, long))
+                continue
+            touch(tray).append({"item_id": code, "x": rect.x, "y": rect.y,
+                                "l": rect.width - padding, "w": rect.height - padding})
+            free_area[tray] -= rect.width * rect.height
+            locations.setdefault(code, []).append(tray)
+            placed = True
+            break
+        if not placed:
+            not_placed.append(code)
+
+    used = [tray for tray, items in new_trays.items() if items]
+    fragmentation = sum(free_area[tray] for tray in used) / (len(used) * tray_area) if used else 0.0
+
+    if not_placed or fragmentation > fragmentation_threshold:
+        debug_print(f"Incrementeel vullen: {len(not_placed)} niet geplaatst, fragmentatie {fragmentation:.2f} "
+                    f"→ volledige herverdeling")
+        items = [(item["l"], item["w"], item["item_id"]) for tray in sorted(new_trays) for item in new_trays[tray]]
+        items += get_ordered_item_dimensions(not_placed, dimensions)
+        full_trays, full_not_placed = fill_trays_bin_packing(items, tray_length, tray_width, len(new_trays))
+        if full_not_placed:
+            debug_print(f"⚠️ {len(full_not_placed)} item(s) passen ook na een volledige herverdeling niet: "
+                        f"{full_not_placed}")
+        _, unused = calculate_unused_space({t: i for t, i in full_trays.items() if i}, tray_length, tray_width)
+        used_full = sum(1 for i in full_trays.values() if i)
+        return full_trays, {
+            "touched_trays": sorted(full_trays),
+            "full_repack": True,
+            "fragmentation": unused / (used_full * tray_area) if used_full else 0.0,
+            "not_placed": full_not_placed
+        }
+
+    return new_trays, {"touched_trays": sorted(touched), "full_repack": False, "fragmentation": fragmentation,
+                       "not_placed": []}
+
+
 # Funtional funtions
 def print_tray_results(tray_items, not_placed, items):
     """
@@ -400,39 +753,94 @@ def calculate_unused_space(tray_items, tray_length, tray_width):
 
     return per_tray_unused, total_unused
 
-def validate_trays(tray_items, tray_length=1.0, tray_width=1.0):
-    def is_out_of_bounds(item):
-        return (
-            item['x'] + item['l'] > tray_length or
-            item['y'] + item['w'] > tray_width
-        )
+def find_tray_violations(tray_items, tray_length=1.0, tray_width=1.0, tray_count=None):
+    """
+    Zoekt items buiten de tray en overlappende items met een sweep-line over NumPy coördinaten.
+    Per tray worden de items op x gesorteerd, enkel paren die op de x-as overlappen worden nog op y gecontroleerd.
+    Dat is O(n log n + k) per tray i.p.v. alle paren te vergelijken.
 
-    def items_overlap(a, b):
-        return not (
-            a['x'] + a['l'] <= b['x'] or
-            b['x'] + b['l'] <= a['x'] or
-            a['y'] + a['w'] <= b['y'] or
-            b['y'] + b['w'] <= a['y']
-        )
+    Parameters:
+    - tray_items: dict van tray_index -> geplaatste items (met x, y, l, w)
+    - tray_length, tray_width: afmetingen van de tray
+    - tray_count: aantal trays in het magazijn (WAREHOUSE_HEIGHT * TRAYS_PER_ROW). Items in een tray_index buiten
+      0..tray_count-1 zijn ook out of bounds: het magazijn in de simulatie zou ze niet opnemen.
 
-    all_valid = True
+    Returns:
+    - out_of_bounds: lijst van (tray_index, item_index)
+    - overlaps: lijst van (tray_index, item_index, ander_item_index)
+    """
+    out_of_bounds = []
+    overlaps = []
 
     for tray_index, items in tray_items.items():
-        for i, item in enumerate(items):
-            if is_out_of_bounds(item):
-                debug_print(f"❌ Item {item['item_id']} in Tray {tray_index} is out of bounds.")
-                all_valid = False
-
-            for j in range(i + 1, len(items)):
-                other = items[j]
-                if items_overlap(item, other):
-                    debug_print(f"❌ Item {item['item_id']} overlaps with Item {other['item_id']} in Tray {tray_index}.")
-                    all_valid = False
-
+        n = len(items)
+        if n == 0:
+            continue
+        if tray_count is not None and not 0 <= tray_index < tray_count:
+            out_of_bounds.extend((tray_index, i) for i in range(n))
+            continue
+
+        coords = np.array([(item['x'], item['y'], item['l'], item['w']) for item in items], dtype=float)
+        x, y, l, w = coords.T
+        x_end = x + l
+        y_end = y + w
+
+        outside = (x < 0) | (y < 0) | (x_end > tray_length) | (y_end > tray_width)
+        out_of_bounds.extend((tray_index, int(i)) for i in np.flatnonzero(outside))
+
+        if n < 2:
+            continue
+
+        # Sweep over x: voor item a (gesorteerd) zijn enkel de volgende items met x < x_end[a] kandidaten
+        order = np.argsort(x, kind="stable")
+        x_sorted = x[order]
+        ends = np.searchsorted(x_sorted, x_end[order], side="left")
+        counts = np.maximum(ends - np.arange(n) - 1, 0)
+        total = counts.sum()
+        if total == 0:
+            continue
+
+        first = np.repeat(np.arange(n), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        a = order[first]
+        b = order[first + 1 + offsets]
+
+        overlapping = ~((x_end[a] <= x[b]) | (x_end[b] <= x[a]) | (y_end[a] <= y[b]) | (y_end[b] <= y[a]))
+        for i, j in zip(a[overlapping], b[overlapping]):
+            overlaps.append((tray_index, int(min(i, j)), int(max(i, j))))
+
+    return out_of_bounds, overlaps
+
+
+def validate_trays(tray_items, tray_length=1.0, tray_width=1.0, tray_count=None):
+    out_of_bounds, overlaps = find_tray_violations(tray_items, tray_length, tray_width, tray_count)
+
+    for tray_index, i in out_of_bounds:
+        if tray_count is not None and not 0 <= tray_index < tray_count:
+            debug_print(f"❌ Item {tray_items[tray_index][i]['item_id']} is in Tray {tray_index}, "
+                        f"the warehouse only has trays 0..{tray_count - 1}.")
+            continue
+        debug_print(f"❌ Item {tray_items[tray_index][i]['item_id']} in Tray {tray_index} is out of bounds.")
+    for tray_index, i, j in overlaps:
+        debug_print(f"❌ Item {tray_items[tray_index][i]['item_id']} overlaps with Item "
+                    f"{tray_items[tray_index][j]['item_id']} in Tray {tray_index}.")
+
+    all_valid = not out_of_bounds and not overlaps
     if all_valid:
         debug_print("✅ All trays are valid: no overlaps and all items within bounds.")
     return all_valid
 
+def check_tray_filling(tray_items, tray_length, tray_width, tray_count=None):
+    """
+    Geeft een fout als er items overlappen, buiten de tray liggen of in een tray buiten 0..tray_count-1 zitten.
+    Enkel dan worden de details geprint (validate_trays).
+    """
+    out_of_bounds, overlaps = find_tray_violations(tray_items, tray_length, tray_width, tray_count)
+    if out_of_bounds or overlaps:
+        validate_trays(tray_items, tray_length=tray_length, tray_width=tray_width,
+                       tray_count=tray_count)  # print the details
+        raise Exception("Trays were not filled properly...")
+
 def get_tray_filling():
     debug_print("Start simulatie")
     # Load all onze Simulated bestellingen en Augemented bestellingen en dimensiematrix
@@ -472,24 +880,79 @@ def get_tray_filling():
 
     return tray_items
 
-def get_tray_filling_from_data(augmented_data, mode,tray_length, tray_width, max_trays ):
-    loaded = load_saved_item_dimensions('Dataverwerking_code/Dataverwerking_data_output/item_dims.json')
+def get_codes_and_dimensions(augmented_data, vocabulary=None):
+    """
+    Alle itemcodes van een voorraad (dict van datum -> itemcodes) in één lijst, met de bijhorende afmetingen.
+    Met een vocabulary zijn de codes indices (int), anders tekst.
+    """
+    if vocabulary is not None:
+        ordered_codes = np.concatenate(list(augmented_data.values())).tolist() if augmented_data else []
+        return ordered_codes, load_encoded_item_dimensions(vocabulary)
     ordered_codes = [str(code) for codes in augmented_data.values() for code in codes]
-    items = get_ordered_item_dimensions(ordered_codes, loaded)
+    return ordered_codes, load_saved_item_dimensions(ITEM_DIMENSIONS_PATH)
+
+def get_tray_filling_from_data(augmented_data, mode,tray_length, tray_width, max_trays, rng=None, multistart=None,
+                               validate=True, vocabulary=None, tray_count=None):
+    """
+    vocabulary: SkuVocabulary als de itemcodes in augmented_data indices zijn (de trays bevatten dan ook indices)
+    multistart: dict met de opties van fill_trays_random_multistart (enkel gebruikt bij mode 5)
+    mode 6 vult trays op basis van co-occurrence in de historische bestellingen (fill_trays_by_affinity)
+    validate: controleer de indeling op overlap en items buiten de tray (goedkoop genoeg om altijd aan te laten)
+    tray_count: aantal trays in het magazijn, tray-indices moeten in 0..tray_count-1 liggen (standaard max_trays)
+    """
+    tray_count = max_trays if tray_count is None else tray_count
+    ordered_codes, dimensions = get_codes_and_dimensions(augmented_data, vocabulary)
+    items = get_ordered_item_dimensions(ordered_codes, dimensions)
 
     if mode == 1:
         tray_items, not_placed = fill_trays_bin_packing(items, tray_length, tray_width, max_trays)
     elif mode == 2:
         tray_items, not_placed = fill_trays_sequential(items, tray_length, tray_width, max_trays)
     elif mode == 3:
-        tray_items, not_placed = fill_trays_random_best_fit(items, tray_length, tray_width, max_trays)
+        tray_items, not_placed = fill_trays_random_best_fit(items, tray_length, tray_width, max_trays, rng=rng)
     elif mode == 4:
         tray_items, not_placed = fill_trays_by_frequency(items, tray_length, tray_width, max_trays)
+    elif mode == 5:
+        options = dict(multistart or {})
+        if "seed" not in options:
+            options["seed"] = rng.randrange(2**32) if rng is not None else 0
+        tray_items, not_placed = fill_trays_random_multistart(items, tray_length, tray_width, max_trays, **options)
+    elif mode == 6:
+        co_matrix, vocab = load_historical_co_occurrence()
+        if vocabulary is not None:
+            vocab = vocabulary.encode_mapping(vocab)
+        tray_items, not_placed = fill_trays_by_affinity(items, co_matrix, vocab, tray_length, tray_width, max_trays)
     else:
         tray_items, not_placed = fill_trays_bin_packing(items, tray_length, tray_width, max_trays)
 
+    if validate:
+        check_tray_filling(tray_items, tray_length, tray_width, tray_count)
+
     return tray_items
 
+def get_tray_filling_incremental(previous_tray_items, previous_data, augmented_data, tray_length, tray_width,
+                                 fragmentation_threshold=0.35, validate=True, vocabulary=None, tray_count=None):
+    """
+    Zoals get_tray_filling_from_data, maar vertrekt van de indeling van een vorige voorraad (previous_data)
+    en past enkel het verschil aan (zie repack_incremental).
+    tray_count: aantal trays in het magazijn (None = de tray-indices niet controleren)
+
+    Returns:
+    - tray_items, info
+    """
+    previous_codes, _ = get_codes_and_dimensions(previous_data, vocabulary)
+    ordered_codes, loaded = get_codes_and_dimensions(augmented_data, vocabulary)
+    added, removed = inventory_delta(previous_codes, ordered_codes)
+    debug_print(f"Incrementeel vullen: {sum(added.values())} eenheden erbij, {sum(removed.values())} eraf")
+
+    tray_items, info = repack_incremental(previous_tray_items, added, removed, loaded, tray_length, tray_width,
+                                          fragmentation_threshold=fragmentation_threshold)
+
+    if validate:
+        check_tray_filling(tray_items, tray_length, tray_width, tray_count)
+
+    return tray_items, info
+
 def main():
     get_tray_filling()
 
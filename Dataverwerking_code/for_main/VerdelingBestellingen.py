@@ -1,3 +1,5 @@
+import copy
+import functools
 import json
 from datetime import datetime, timedelta
 import pandas as pd
@@ -7,10 +9,26 @@ from pathlib import Path
 
 from scipy import stats
 
+from Dataverwerking_code.for_main.Sku_vocabulary import SkuVocabulary
+
 
 SIMULATION_HOURS = 1
 OVERFILL_PERCENTAGE = 0.2
 
+# bestandspaden = [
+#     '../Dataverwerking_data_Input/1_VerdelingItem01_03.xlsx',
+#     ...
+# ]
+# Changed scope when calling from main script in root
+BESTANDSPADEN = (
+    'Dataverwerking_code/Dataverwerking_data_Input/1_VerdelingItem01_03.xlsx',
+    'Dataverwerking_code/Dataverwerking_data_Input/2_VerdelingItem04_06.xlsx',
+    'Dataverwerking_code/Dataverwerking_data_Input/3_VerdelingItem07_09.xlsx',
+    'Dataverwerking_code/Dataverwerking_data_Input/4_VerdelingItem10_12.xlsx',
+    'Dataverwerking_code/Dataverwerking_data_Input/5_VerdelingItem13_15.xlsx',
+    'Dataverwerking_code/Dataverwerking_data_Input/6_VerdelingItem16_19.xlsx',
+)
+
 USE_PRINT = False
 
 def debug_print(*args, **kwargs):
@@ -18,26 +36,29 @@ def debug_print(*args, **kwargs):
     if USE_PRINT:
         print(*args, **kwargs)
 
-def save_simulation(sim_data: dict[datetime, list[str]], filename: str) -> None:
+def save_simulation(sim_data: dict[datetime, np.ndarray], filename: str, vocabulary: SkuVocabulary = None) -> None:
     """
     Schrijft simulatieresultaten weg naar CSV.
-    - sim_data: dict van datum naar lijst itemcodes
+    - sim_data: dict van datum naar itemcodes
     - filename: outputbestand (CSV)
+    - vocabulary: zet geïndexeerde itemcodes terug naar tekst
     """
     records = [
         {"date": date, "item_code": code}
         for date, codes in sim_data.items()
-        for code in codes
+        for code in (vocabulary.decode(codes) if vocabulary is not None else codes)
     ]
     pd.DataFrame(records).to_csv(filename, index=False)
 
 
-def load_excel_data(file_paths: list[str], sheet_name: str = 'BestellingDensity') -> tuple[list[float], pd.Series, dict[str, pd.Series]]:
+@functools.lru_cache(maxsize=None)
+def load_excel_data(file_paths: tuple[str, ...], sheet_name: str = 'BestellingDensity') -> tuple[list[float], pd.Series, dict[str, pd.Series]]:
     """
     Leest Excel-bestanden in en berekent:
     1) hourly_rates_per_file: gemiddelde orders per uur per bestand
     2) global_freq_series: totale frequentie per itemcode over alle bestanden
     3) file_freqs: dict per bestand van itemcode->frequentie
+    Wordt één keer per proces ingelezen (file_paths moet daarom een tuple zijn), de resultaten niet aanpassen.
     """
     hourly_rates: list[float] = []
     file_freqs: dict[str, pd.Series] = {}
@@ -63,14 +84,62 @@ def load_excel_data(file_paths: list[str], sheet_name: str = 'BestellingDensity'
 
     return hourly_rates, global_freq_series, file_freqs
 
+
+@functools.lru_cache(maxsize=None)
+def get_sku_vocabulary(file_paths: tuple[str, ...] = BESTANDSPADEN) -> SkuVocabulary:
+    """ Eén vocabulary van alle itemcodes in de Excel-bestanden, meest gevraagde items eerst. """
+    _, global_freq, _ = load_excel_data(file_paths)
+    return SkuVocabulary(global_freq.index)
+
+class AliasSampler:
+    """
+    Walker/Vose alias-tabel voor het trekken van itemcodes volgens vaste gewichten.
+    De tabel wordt één keer opgebouwd (O(n)), daarna kost elke trekking O(1):
+    een uniforme index plus één vergelijking met de kans van die kolom.
+    """
+    def __init__(self, codes, weights):
+        self.codes = np.asarray(codes)
+        weights = np.asarray(weights, dtype=float)
+        n = len(weights)
+        scaled = weights / weights.sum() * n
+
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Wat overblijft heeft (op afrondingsfouten na) kans 1
+
+    def sample_indices(self, k, np_rng):
+        columns = np_rng.integers(len(self.prob), size=k)
+        return np.where(np_rng.random(k) < self.prob[columns], columns, self.alias[columns])
+
+    def sample(self, k, np_rng):
+        """ k itemcodes (numpy array), met teruglegging. """
+        return self.codes[self.sample_indices(k, np_rng)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_alias_sampler(distribution: str = 'global', file_paths: tuple[str, ...] = BESTANDSPADEN) -> AliasSampler:
+    """ Alias-tabel van één distributie ('global' of een Excel-bestand), één keer per proces opgebouwd. """
+    _, global_freq, file_freqs = load_excel_data(file_paths)
+    freq = global_freq if distribution == 'global' else file_freqs[distribution]
+    return AliasSampler(get_sku_vocabulary(file_paths).encode(freq.index), (freq / freq.sum()).tolist())
+
+
 def simulate_period(
     start_date: datetime,
     hours: int,
     hourly_rates: list[float],
     freq_distribution: pd.Series,
     dist_name: str = 'global',
-    rng=None, np_rng=None
-) -> dict[datetime, list[str]]:
+    rng=None, np_rng=None, sampler=None
+) -> dict[datetime, np.ndarray]:
     """
     Simuleert orders per uur:
     - start_date: datum waarop simulatie begint
@@ -78,14 +147,13 @@ def simulate_period(
     - hourly_rates: lijst van lambda-waarden
     - freq_distribution: pd.Series(index=item_code, value=gewichten)
     - dist_name: naam van de distributie
+    - sampler: AliasSampler van freq_distribution (wordt anders hier opgebouwd)
 
-    Retourneert dict date -> list of itemcodes
+    Retourneert dict date -> array van itemcodes
     """
     rng = rng or random.Random()
     np_rng = np_rng or np.random.default_rng()
-
-    codes = freq_distribution.index.tolist()
-    weights = (freq_distribution / freq_distribution.sum()).tolist()
+    sampler = sampler or AliasSampler(freq_distribution.index, freq_distribution.to_numpy())
 
     sim_output: dict[datetime, list[str]] = {}
     debug_print(f"Simulatie van {start_date.date()} over {hours} uren met '{dist_name}' distributie")
@@ -94,7 +162,7 @@ def simulate_period(
         current_date = start_date + timedelta(hours=i)
         lam = rng.choice(hourly_rates)
         n_orders = np_rng.poisson(lam)
-        picks = rng.choices(codes, weights=weights, k=n_orders)
+        picks = sampler.sample(n_orders, np_rng)
         sim_output[current_date] = picks
 
     return sim_output
@@ -129,26 +197,27 @@ def compute_extra_count(picks: list[str], mode: str = 'percent', value: float =
 
 
 def augment_simulation(
-    sim_output: dict[datetime, list[str]],
+    sim_output: dict[datetime, np.ndarray],
     code_lists: dict[str, list[str]],
     weight_lists: dict[str, list[float]],
     mode: str,
     value: float,
     source_name: str,
-        rng=None
-) -> dict[datetime, list[str]]:
+        np_rng=None, sampler=None
+) -> dict[datetime, np.ndarray]:
     """
     Augmenteert elke uur met extra picks gebaseerd op bron en mode
+    - code_lists, weight_lists: codes en gewichten per distributie, enkel nodig zonder sampler
+    - sampler: AliasSampler van de bron (wordt anders hier één keer opgebouwd)
     """
-    rng = rng or random.Random()
+    np_rng = np_rng or np.random.default_rng()
+    sampler = sampler or AliasSampler(code_lists[source_name], weight_lists[source_name])
 
     augmented: dict[datetime, list[str]] = {}
     for date, picks in sim_output.items():
         extra_n = compute_extra_count(picks, mode, value)
-        codes = code_lists[source_name]
-        weights = weight_lists[source_name]
-        extra_picks = rng.choices(codes, weights=weights, k=extra_n)
-        augmented[date] = picks + extra_picks
+        extra_picks = sampler.sample(extra_n, np_rng)
+        augmented[date] = np.concatenate((picks, extra_picks))
     return augmented
 
 def genereer_nb_waarde(r, p, np_rng=None):
@@ -162,58 +231,59 @@ def genereer_zinb_waarde(pi,r, p):
     else:
         return stats.nbinom.rvs(r, p) +1
 
-def group_all_items_into_orders(sim_output: dict[datetime, list[str]], r: float, p: float, np_rng=None) -> list[list[str]]:
+def genereer_nb_waarden(r, p, n, np_rng=None):
+    """ n waarden zoals genereer_nb_waarde, in één keer getrokken (nbinom.rvs gebruikt zelf ook negative_binomial). """
+    np_rng = np_rng or np.random.default_rng()
+    return np_rng.negative_binomial(r, p, size=n) + 1
+
+def group_all_items_into_orders(sim_output: dict[datetime, np.ndarray], r: float, p: float, np_rng=None) -> list[np.ndarray]:
     """
     Groepeert alle items uit de hele sim onafhankelijk van tijd in bestellingen,
-    met aantallen bepaald door genereer_nb_waarde(r, p).
-    Retourneert: lijst van bestellingen (elke bestelling is een lijst van itemcodes).
+    met aantallen bepaald door genereer_nb_waarden(r, p).
+    De groottes worden per batch getrokken tot hun cumulatieve som alle items dekt, daarna wordt de lijst
+    op die grenzen gesplitst. De laatste bestelling krijgt de items die overblijven.
+    Retourneert: lijst van bestellingen (elke bestelling is een numpy array van itemcodes).
     """
-    all_items = [item for items in sim_output.values() for item in items]
-    i = 0
-    grouped_orders = []
-    while i < len(all_items):
-        n_items = genereer_nb_waarde(r, p, np_rng=np_rng)
-        order = all_items[i:i + n_items]
-        grouped_orders.append(order)
-        i += n_items
-    return grouped_orders
-
-def save_grouped_orders_flat(orders: list[list[str]], filename: str) -> None:
+    np_rng = np_rng or np.random.default_rng()
+    all_items = np.concatenate(list(sim_output.values())) if sim_output else np.zeros(0, dtype=np.int32)
+    n_total = len(all_items)
+
+    # Batchgrootte op basis van de verwachte bestellingsgrootte 1 + r(1-p)/p, met wat marge
+    mean_size = 1 + r * (1 - p) / p
+    sizes = []
+    covered = 0
+    while covered < n_total:
+        batch = genereer_nb_waarden(r, p, int((n_total - covered) / mean_size * 1.1) + 16, np_rng=np_rng)
+        sizes.append(batch)
+        covered += int(batch.sum())
+
+    ends = np.cumsum(np.concatenate(sizes)) if sizes else np.zeros(0, dtype=np.int64)
+    # Alleen de bestellingen die nog items krijgen: de eerste grens >= n_total sluit de laatste bestelling af
+    n_orders = int(np.searchsorted(ends, n_total)) + 1 if n_total else 0
+    return np.split(all_items, ends[:n_orders - 1]) if n_orders else []
+
+def save_grouped_orders_flat(orders: list[np.ndarray], filename: str, vocabulary: SkuVocabulary = None) -> None:
     records = [
-        {"order_id": i+1, "items": ",".join(map(str, order))}
+        {"order_id": i+1, "items": ",".join(vocabulary.decode(order) if vocabulary is not None else map(str, order))}
         for i, order in enumerate(orders)
     ]
     pd.DataFrame(records).to_csv(filename, index=False)
 
-def get_inventory_and_orders(hours, rng=None, np_rng=None):
+def get_inventory_and_orders(hours, rng=None, np_rng=None, augmentation_rng=None, order_size_rng=None):
+    """
+    rng, np_rng: random generators voor de orders (np_rng standaard ook gebruikt voor augmentatie en bestellingsgroottes)
+    augmentation_rng: numpy Generator voor de extra picks van de augmentatie
+    order_size_rng: numpy Generator voor de groottes van de bestellingen
+    Met aparte generators blijft elke stap dezelfde getallen trekken als een andere stap verandert.
+    Itemcodes zijn indices in get_sku_vocabulary() (int32), zowel in sim en aug_sim als in de bestellingen.
+    """
     rng = rng or random.Random()
     np_rng = np_rng or np.random.default_rng()
-
-    # bestandspaden = [
-    #     '../Dataverwerking_data_Input/1_VerdelingItem01_03.xlsx',
-    #     '../Dataverwerking_data_Input/2_VerdelingItem04_06.xlsx',
-    #     '../Dataverwerking_data_Input/3_VerdelingItem07_09.xlsx',
-    #     '../Dataverwerking_data_Input/4_VerdelingItem10_12.xlsx',
-    #     '../Dataverwerking_data_Input/5_VerdelingItem13_15.xlsx',
-    #     '../Dataverwerking_data_Input/6_VerdelingItem16_19.xlsx',
-    # ]
-    # Changed scope when calling from main script in root
-    bestandspaden = [
-        'Dataverwerking_code/Dataverwerking_data_Input/1_VerdelingItem01_03.xlsx',
-        'Dataverwerking_code/Dataverwerking_data_Input/2_VerdelingItem04_06.xlsx',
-        'Dataverwerking_code/Dataverwerking_data_Input/3_VerdelingItem07_09.xlsx',
-        'Dataverwerking_code/Dataverwerking_data_Input/4_VerdelingItem10_12.xlsx',
-        'Dataverwerking_code/Dataverwerking_data_Input/5_VerdelingItem13_15.xlsx',
-        'Dataverwerking_code/Dataverwerking_data_Input/6_VerdelingItem16_19.xlsx',
-    ]
+    augmentation_rng = augmentation_rng or np_rng
+    order_size_rng = order_size_rng or np_rng
 
     # 1) data inladen
-    hourly_rates, global_freq, file_freqs = load_excel_data(bestandspaden)
-
-    code_lists = {f: list(freq.index) for f, freq in file_freqs.items()}
-    weight_lists = {f: (freq / freq.sum()).tolist() for f, freq in file_freqs.items()}
-    code_lists['global'] = list(global_freq.index)
-    weight_lists['global'] = (global_freq / global_freq.sum()).tolist()
+    hourly_rates, global_freq, file_freqs = load_excel_data(BESTANDSPADEN)
 
     # 3) Kies distributie
     choice = "global"
@@ -224,7 +294,8 @@ def get_inventory_and_orders(hours, rng=None, np_rng=None):
 
     # 5) Simuleer
     freq_dist = global_freq if choice == 'global' else file_freqs[choice]
-    sim = simulate_period(start_date, hours, hourly_rates, freq_dist, dist_name=choice, rng=rng, np_rng=np_rng)
+    sim = simulate_period(start_date, hours, hourly_rates, freq_dist, dist_name=choice, rng=rng, np_rng=np_rng,
+                          sampler=get_alias_sampler(choice))
 
     # 6) Augmentatie vraag
     aug_answer = "ja"
@@ -239,12 +310,14 @@ def get_inventory_and_orders(hours, rng=None, np_rng=None):
         else:
             value = OVERFILL_PERCENTAGE
 
-        aug_sim = augment_simulation(sim, code_lists, weight_lists, mode, value, src_choice, rng=rng)
+        # De alias-tabel vervangt code_lists en weight_lists
+        aug_sim = augment_simulation(sim, None, None, mode, value, src_choice, np_rng=augmentation_rng,
+                                     sampler=get_alias_sampler(src_choice))
 
     # 7) Opslaan
-    # save_simulation(sim, 'Dataverwerking_code/Dataverwerking_data_output/sim_output.csv')
+    # save_simulation(sim, 'Dataverwerking_code/Dataverwerking_data_output/sim_output.csv', vocabulary)
     # if aug_answer.lower().startswith('j'):
-    #     save_simulation(aug_sim, 'Dataverwerking_code/Dataverwerking_data_output/augmented_output.csv')
+    #     save_simulation(aug_sim, 'Dataverwerking_code/Dataverwerking_data_output/augmented_output.csv', vocabulary)
 
     debug_print("\nSimulatie voltooid. Resultaten opgeslagen.")
 
@@ -263,12 +336,139 @@ def get_inventory_and_orders(hours, rng=None, np_rng=None):
     # debug_print("NB → r:", r_nb, "p:", p_nb)
     # debug_print("ZINB → pi:", pi_opt, "r:", r_zinb, "p:", p_zinb)
 
-    grouped_orders = group_all_items_into_orders(sim, r_nb, p_nb, np_rng=np_rng)
-    # save_grouped_orders_flat(grouped_orders, 'Dataverwerking_data_output/grouped_orders.csv')
+    grouped_orders = group_all_items_into_orders(sim, r_nb, p_nb, np_rng=order_size_rng)
+    # save_grouped_orders_flat(grouped_orders, 'Dataverwerking_data_output/grouped_orders.csv', vocabulary)
 
 
     return sim, aug_sim, grouped_orders
 
+def load_order_size_parameters():
+    """ r en p van de negatief binomiale verdeling van de bestellingsgrootte (simulatie_parameters.json). """
+    with open("Dataverwerking_code/simulatie_parameters.json", "r") as f:
+        parameters = json.load(f)
+    return parameters["negative_binomial"]["r"], parameters["negative_binomial"]["p"]
+
+def stream_hourly_picks(hours, hourly_rates, sampler, value, rng, np_rng, augmentation_rng):
+    """
+    Generator met per uur (picks, extra_picks): dezelfde trekkingen als simulate_period en augment_simulation
+    (mode 'percent'), maar uur per uur in plaats van voor de hele periode.
+    """
+    for _ in range(hours):
+        lam = rng.choice(hourly_rates)
+        picks = sampler.sample(np_rng.poisson(lam), np_rng)
+        extra_picks = sampler.sample(compute_extra_count(picks, 'percent', value), augmentation_rng)
+        yield picks, extra_picks
+
+def stream_orders(hourly_picks, r, p, np_rng, batch_size=1024):
+    """
+    Generator die de items van hourly_picks (een array per uur) in bestellingen groepeert zoals
+    group_all_items_into_orders: een bestelling kan over de grens van een uur lopen en de laatste bestelling krijgt
+    de items die overblijven. De groottes worden per batch_size getrokken.
+    """
+    sizes = np.zeros(0, dtype=np.int64)
+    size_index = 0
+    parts = []  # stukken van de huidige bestelling
+    missing = 0  # aantal items dat de huidige bestelling nog nodig heeft
+    for picks in hourly_picks:
+        start = 0
+        while start < len(picks):
+            if not parts:
+                if size_index == len(sizes):
+                    sizes, size_index = genereer_nb_waarden(r, p, batch_size, np_rng=np_rng), 0
+                missing = int(sizes[size_index])
+                size_index += 1
+            part = picks[start:start + missing]
+            parts.append(part)
+            start += len(part)
+            missing -= len(part)
+            if missing == 0:
+                yield np.concatenate(parts)
+                parts = []
+    if parts:
+        yield np.concatenate(parts)
+
+def get_order_stream(hours, rng=None, np_rng=None, augmentation_rng=None, order_size_rng=None):
+    """
+    Zoals get_inventory_and_orders, maar zonder alle uren en bestellingen tegelijk in het geheugen te houden.
+    Een eerste doorloop telt per itemcode hoeveel eenheden besteld en aangevuld worden (de voorraad).
+    De bestellingen worden daarna lui gegroepeerd uit dezelfde uren, opnieuw getrokken vanaf een kopie van de generators.
+
+    Returns:
+    - amount_of_items: aantal bestelde items
+    - inventory: dict met één array van itemcodes (gesorteerd per code), te gebruiken zoals aug_sim
+    - orders: functie die telkens een nieuwe generator van dezelfde bestellingen (arrays van itemcodes) geeft
+    - hourly_counts: aantal bestelde items per uur (zie OrderReleaseTimes)
+    """
+    rng = rng or random.Random()
+    np_rng = np_rng or np.random.default_rng()
+    augmentation_rng = augmentation_rng or np_rng
+    order_size_rng = order_size_rng or np_rng
+
+    hourly_rates, _, _ = load_excel_data(BESTANDSPADEN)
+    vocabulary = get_sku_vocabulary(BESTANDSPADEN)
+    sampler = get_alias_sampler('global')
+    r_nb, p_nb = load_order_size_parameters()
+
+    # De groottes hebben een eigen generator nodig: als order_size_rng dezelfde generator is als die van de uren,
+    # zou de tweede doorloop (die ook groottes trekt) andere uren trekken dan de eerste
+    if order_size_rng is np_rng or order_size_rng is augmentation_rng:
+        order_size_rng = np.random.default_rng(int(order_size_rng.integers(2**63)))
+    start_state = copy.deepcopy((rng, np_rng, augmentation_rng, order_size_rng))
+
+    ordered = np.zeros(len(vocabulary), dtype=np.int64)
+    stocked = np.zeros(len(vocabulary), dtype=np.int64)
+    hourly_counts = []
+    for picks, extra_picks in stream_hourly_picks(hours, hourly_rates, sampler, OVERFILL_PERCENTAGE,
+                                                  rng, np_rng, augmentation_rng):
+        hourly_counts.append(len(picks))
+        ordered += np.bincount(picks, minlength=len(vocabulary))
+        stocked += np.bincount(extra_picks, minlength=len(vocabulary))
+    stocked += ordered
+    inventory = {"inventory": np.repeat(np.arange(len(vocabulary), dtype=np.int32), stocked)}
+
+    def orders():
+        *generators, size_rng = copy.deepcopy(start_state)
+        hourly_picks = (picks for picks, _ in stream_hourly_picks(hours, hourly_rates, sampler, OVERFILL_PERCENTAGE,
+                                                                   *generators))
+        return stream_orders(hourly_picks, r_nb, p_nb, size_rng)
+
+    return int(ordered.sum()), inventory, orders, hourly_counts
+
+class OrderReleaseTimes:
+    """
+    Tijdstippen (seconden) waarop de bestellingen vrijkomen voor de operator.
+    De items komen binnen volgens het Poisson-proces van simulate_period: gegeven het aantal items in een uur liggen
+    hun aankomsttijden uniform verdeeld binnen dat uur. Een bestelling komt vrij wanneer haar laatste item binnenkomt.
+    Met rate_factor > 1 komen de bestellingen sneller binnen (hogere belasting), de tijden worden gedeeld door rate_factor.
+
+    Parameters:
+    - hourly_counts: aantal items per uur, in volgorde
+    - np_rng: numpy Generator voor de aankomsttijden
+    - rate_factor: versnelling van het aankomstproces
+    """
+    def __init__(self, hourly_counts, np_rng=None, rate_factor=1.0):
+        self.hours = iter(enumerate(hourly_counts))
+        self.np_rng = np_rng or np.random.default_rng()
+        self.rate_factor = rate_factor
+        self.times = np.zeros(0)  # aankomsttijden van de items in het huidige uur
+        self.index = 0  # volgende item in self.times
+        self.last_time = 0.0
+
+    def release_time(self, order_size):
+        """ Tijdstip waarop de volgende bestelling (met order_size items) vrijkomt. """
+        remaining = order_size
+        while remaining > len(self.times) - self.index:
+            remaining -= len(self.times) - self.index
+            hour, count = next(self.hours, (None, 0))
+            if hour is None:
+                return self.last_time  # niet meer items dan gesimuleerd, enkel voor de zekerheid
+            self.times = (hour + np.sort(self.np_rng.random(count))) * 3600 / self.rate_factor
+            self.index = 0
+        self.index += remaining
+        if self.index:
+            self.last_time = float(self.times[self.index - 1])
+        return self.last_time
+
 def main():
     get_inventory_and_orders()
 
@@ -10,7 +10,7 @@ from types import SimpleNamespace
 from salabim import SimulationStopped
 
 # To get the result of other python scripts
-from Dataverwerking_code.for_main.VerdelingBestellingen import get_inventory_and_orders
+from Dataverwerking_code.for_main.VerdelingBestellingen import get_inventory_and_orders, get_sku_vocabulary
 from Dataverwerking_code.for_main.Tray_filling import get_tray_filling_from_data
 from Dataverwerking_code.for_main.Picktijden import generate_picktime_samples
 
@@ -39,6 +39,7 @@ config = load_config("Configurations/base.yaml")
 
 event_log = []
 unfulfilled_requests = []
+sku_vocabulary = get_sku_vocabulary()  # item codes are indices in this vocabulary, only written as text in the output files
 
 ''' ====================== Classes ====================== '''
 class Operator(sim.Component):
@@ -88,7 +89,7 @@ class Operator(sim.Component):
                 env.request_start = env.now()
                 env.item_picking_times = []
 
-                debug_print(f"-------- {item_name.upper()} -------")
+                debug_print(f"-------- {item_name} -------")
                 # Retreive request information
                 debug_print(f"Processing the request: {item_name}\n")
 
@@ -603,13 +604,13 @@ def fill_warehouse_from_tray_items(tray_items, warehouse):
     for tray_id, items in tray_items.items():
         for item_data in items:
             item_id = item_data["item_id"]
-            warehouse.add_item(Item(name=str(item_id)), tray_id=tray_id)
+            warehouse.add_item(Item(name=item_id), tray_id=tray_id)
 
 
 def create_requests_from_grouped_orders(grouped_orders):
     requests = []
     for group in grouped_orders:
-        item_names = [str(item_id) for item_id in group]  # Zet ints om naar strings
+        item_names = np.asarray(group).tolist()  # Indices in sku_vocabulary, as Python ints
         requests.append(Request(item_names=item_names))
     return requests
 
@@ -737,7 +738,7 @@ def log_time(item_code, request_index, time_value, log_type):
 
     with open(log_path, "a") as f:
         json.dump({
-            "item_code": item_code,
+            "item_code": sku_vocabulary.decode_one(item_code),
             "request_index": request_index,
             key_name: time_value
         }, f)
@@ -772,7 +773,8 @@ initialize_result_files()
 for run in range(config.AMOUNT_OF_RUNS):
     # Create the orders, inventory and fill the trays
     order_list, inventory_list, grouped_orders = get_inventory_and_orders(config.hours)
-    tray_items = get_tray_filling_from_data(inventory_list, config.TRAY_FILLING_MODE, config.tray_length, config.tray_width, config.max_trays)
+    tray_items = get_tray_filling_from_data(inventory_list, config.TRAY_FILLING_MODE, config.tray_length, config.tray_width, config.max_trays,
+                                            vocabulary=sku_vocabulary)
 
     # Variables to calculate the throughput of the system. Divide the total time and count to get the average time per item
     # Easily calculate items per hour using: 3600 / average_time
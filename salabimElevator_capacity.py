@@ -0,0 +1,121 @@
+import argparse
+import json
+import multiprocessing
+import os
+
+from salabimElevator_multiprocessing import (
+    RunningStatistic, SimulationPool, initialize_result_files, merge_and_clean_jsonl_files, run_with_config
+)
+from salabimElevator_sweep import load_yaml
+
+''' =============== Capacity search: the highest sustainable order rate =============== '''
+# With ORDER_ARRIVALS, ARRIVAL_RATE_FACTOR lets the orders of the configuration arrive faster. This script searches the
+# largest factor at which the VLM still keeps up, where "keeping up" means both:
+#   - the average sojourn time of an order (arrival until finished) is at most --max-sojourn seconds
+#   - realized_items_per_hour / offered_items_per_hour is at least --min-throughput-ratio (the queue doesn't keep
+#     growing, so the run doesn't end long after the last order arrived)
+# The factor is doubled until the VLM saturates, then the bracket is bisected (on a log scale) until
+# high / low <= 1 + --precision. Every factor uses the same run indices (common random numbers: the same orders arrive,
+# only faster), so the comparison between factors isn't blurred by different orders.
+# Replications are added per factor in batches, only while the 95% interval of a criterion still contains its
+# threshold (up to --max-replications), so clear cases cost one batch.
+# Usage:
+#   python salabimElevator_capacity.py Configurations/base.yaml --max-sojourn 900 --min-throughput-ratio 0.95
+# The evaluated factors and the result are saved in main_result_output/<name>_capacity/capacity.json
+
+
+def evaluate(pool, config_dict, factor, args):
+    """ Runs replications at one arrival rate factor. Returns a dict with the statistics and whether it saturated. """
+    config_dict = dict(config_dict, ORDER_ARRIVALS=True, ARRIVAL_RATE_FACTOR=factor,
+                       name=f"{config_dict['name']}_capacity/ARRIVAL_RATE_FACTOR={factor:.4g}")
+    initialize_result_files(config_dict["name"])
+    sojourn = RunningStatistic()
+    ratio = RunningStatistic()
+
+    while True:
+        tasks = [(config_dict, run_index) for run_index in range(sojourn.n, sojourn.n + args.replications)]
+        for _, summary in pool.map(run_with_config, tasks):
+            sojourn.add(summary["average_sojourn_time"])
+            ratio.add(summary["realized_items_per_hour"] / summary["offered_items_per_hour"])
+
+        # A criterion is decided when its interval no longer contains the threshold
+        sojourn_decided = abs(sojourn.mean - args.max_sojourn) > sojourn.half_width()
+        ratio_decided = abs(ratio.mean - args.min_throughput_ratio) > ratio.half_width()
+        violated = ((sojourn_decided and sojourn.mean > args.max_sojourn)
+                    or (ratio_decided and ratio.mean < args.min_throughput_ratio))
+        if violated or (sojourn_decided and ratio_decided) or sojourn.n >= args.max_replications:
+            break
+
+    folder = os.path.join("main_result_output", config_dict["name"])
+    for base_filename in ["picking_times", "handling_times", "order_times", "summary"]:
+        merge_and_clean_jsonl_files(folder, base_filename)
+
+    saturated = sojourn.mean > args.max_sojourn or ratio.mean < args.min_throughput_ratio
+    print(f"ARRIVAL_RATE_FACTOR={factor:.4g}: sojourn {sojourn.mean:.1f} ± {sojourn.half_width():.1f} s, "
+          f"throughput ratio {ratio.mean:.3f} ± {ratio.half_width():.3f} ({sojourn.n} runs) -> "
+          f"{'saturated' if saturated else 'sustainable'}")
+    return {"factor": factor, "runs": sojourn.n, "saturated": saturated,
+            "average_sojourn_time": sojourn.to_dict(), "throughput_ratio": ratio.to_dict()}
+
+
+def search_capacity(config_dict, args, processes=None):
+    evaluations = []
+    with SimulationPool(processes, memory_fraction=config_dict.get("MEMORY_FRACTION", 0.8)) as pool:
+        def saturated(factor):
+            evaluations.append(evaluate(pool, config_dict, factor, args))
+            return evaluations[-1]["saturated"]
+
+        # Bracket: low is sustainable, high is saturated
+        low, high = args.low, args.low * 2
+        if saturated(low):
+            print(f"The VLM is already saturated at ARRIVAL_RATE_FACTOR={low}, start lower with --low")
+            return {"capacity_factor": None, "evaluations": evaluations}
+        while not saturated(high):
+            low, high = high, high * 2
+            if high > args.max_factor:
+                print(f"Not saturated below --max-factor {args.max_factor}")
+                return {"capacity_factor": None, "lower_bound": low, "evaluations": evaluations}
+
+        # Bisection on a log scale (the rate factor is a ratio)
+        while high / low > 1 + args.precision:
+            middle = (low * high) ** 0.5
+            if saturated(middle):
+                high = middle
+            else:
+                low = middle
+
+    total_runs = sum(evaluation["runs"] for evaluation in evaluations)
+    print(f"Capacity: ARRIVAL_RATE_FACTOR between {low:.4g} and {high:.4g} ({len(evaluations)} factors, {total_runs} runs)")
+    return {"capacity_factor": low, "saturated_factor": high, "runs": total_runs, "evaluations": evaluations}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config")
+    parser.add_argument("--max-sojourn", type=float, default=900.0, help="seconds (average sojourn time of an order)")
+    parser.add_argument("--min-throughput-ratio", type=float, default=0.95,
+                        help="minimum realized / offered items per hour")
+    parser.add_argument("--low", type=float, default=1.0, help="first arrival rate factor")
+    parser.add_argument("--max-factor", type=float, default=256.0)
+    parser.add_argument("--precision", type=float, default=0.05, help="stop when high / low <= 1 + precision")
+    parser.add_argument("--replications", type=int, default=5, help="runs per batch")
+    parser.add_argument("--max-replications", type=int, default=30, help="runs per factor at most")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    config_dict = load_yaml(args.config)
+    config_dict.setdefault("name", os.path.splitext(os.path.basename(args.config))[0])
+    result = search_capacity(config_dict, args, processes=args.processes)
+    result["criteria"] = {"max_sojourn": args.max_sojourn, "min_throughput_ratio": args.min_throughput_ratio}
+
+    folder = os.path.join("main_result_output", f"{config_dict['name']}_capacity")
+    os.makedirs(folder, exist_ok=True)
+    result_path = os.path.join(folder, "capacity.json")
+    with open(result_path, "w") as f:
+        json.dump(result, f, indent=4)
+    print(f"Saved to {result_path}")
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")  # Required on Windows
+    main()
@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import salabimElevator_multiprocessing as simulation
+from salabimElevator_multiprocessing import (
+    ELEVATOR_PAUSE_AT_LEVEL_TIME, Tray, calculate_travel_time, fill_trays, get_inventory_and_orders, initialize_result_files, make_random_streams,
+    merge_and_clean_jsonl_files, set_config
+)
+from salabimElevator_sweep import build_scenarios, load_yaml
+from Dataverwerking_code.for_main.Co_occurrentie import sku_tray_map
+from Dataverwerking_code.for_main.Picktijden import picktime_mean
+from Dataverwerking_code.for_main.VerdelingBestellingen import get_sku_vocabulary
+
+''' =============== Closed-form throughput estimate of one lift =============== '''
+# Expected throughput of the single-lift model without running the simulation.
+# Every tray visit of the simulation (the operator handles one tray at a time) takes:
+#   travel from the previous tray level to the new one + travel to the operator and back (3 moves, each with a pause)
+#   + 2 * ELEVATOR_RETRIEVE_TIME (load at the tray and again at the operator) + 2 * ELEVATOR_RETURN_TIME (present
+#   the tray and put it back) + the picking time of every item of the order that is on that tray.
+# The levels of consecutive visits are taken as independent draws from the level-access distribution (how often each
+# level is visited given the orders and the tray layout), so the expected travel time follows from the travel-time
+# table. Trays running empty during the simulation are not taken into account.
+# throughput (items/hour) = 3600 * items per visit / expected visit time, like throughput_items_per_hour of a run.
+#
+# Usage:
+#   python salabimElevator_estimator.py validate Configurations/base.yaml Configurations/base_big_trays.yaml --runs 5
+#       estimate and simulate the same runs (same orders and layout) and compare the throughput
+#   python salabimElevator_estimator.py screen Configurations/sweeps/warehouse_height.yaml --top 5
+#       estimate every scenario of a sweep, saved in main_result_output/<sweep>/screening.csv
+#       (scenarios that only differ in lift parameters share the orders and the tray layout, so they cost nothing)
+
+# Parameters that don't change the orders or the tray layout, only the lift
+LIFT_PARAMETERS = {"WAREHOUSE_HEIGHT", "OPERATOR_LEVEL", "ELEVATOR_RETRIEVE_TIME", "ELEVATOR_RETURN_TIME", "name"}
+
+
+def layout_statistics(run_index=0):
+    """
+    Creates the orders and the tray layout of run run_index of the active configuration (the same random streams as
+    run_simulation_once) and counts the tray visits they cause.
+
+    Returns:
+    - tray_visits: Counter of tray id -> amount of visits (distinct trays per order)
+    - items: amount of items in the orders that are on a tray
+    """
+    simulation.sku_vocabulary = get_sku_vocabulary()
+    config = simulation.config
+    if getattr(config, "COMMON_RANDOM_NUMBERS", True):
+        streams, _ = make_random_streams(run_index)
+    else:
+        rng = random.Random(run_index)
+        np_rng = np.random.default_rng(seed=run_index)
+        streams = {name: (rng, np_rng) for name in simulation.RANDOM_STREAMS}
+
+    _, inventory_list, grouped_orders = get_inventory_and_orders(
+        config.hours, rng=streams["orders"][0], np_rng=streams["orders"][1],
+        augmentation_rng=streams["augmentation"][1], order_size_rng=streams["order_sizes"][1])
+    tray_items = fill_trays(inventory_list, streams["tray_filling"][0])
+
+    # The simulation takes an item from the first tray that has it (Warehouse.locate_item)
+    first_tray = sku_tray_map(tray_items)
+    tray_visits = Counter()
+    items = 0
+    for order in grouped_orders:
+        trays = [first_tray[code] for code in order.tolist() if code in first_tray]
+        tray_visits.update(set(trays))
+        items += len(trays)
+    return tray_visits, items
+
+
+def travel_time_table(distance):
+    """ Travel time (without the pause) for every distance 0..distance in levels. """
+    return np.array([calculate_travel_time(0, d) for d in range(distance + 1)])
+
+
+def estimate_throughput(tray_visits, items, pick_time, config_dict):
+    """
+    Expected visit time and throughput for a level-access distribution given as tray visits.
+    Uses the lift parameters of config_dict (WAREHOUSE_HEIGHT only matters through the levels of the trays).
+    Returns a dict with the parts of the expected visit time and the throughput in items/hour.
+    """
+    set_config(config_dict)  # Tray uses TRAYS_PER_ROW of the active configuration
+    visits = sum(tray_visits.values())
+    levels = np.array([Tray(tray_id).level for tray_id in tray_visits])
+    probabilities = np.array(list(tray_visits.values()), dtype=float) / visits
+    operator_level = config_dict["OPERATOR_LEVEL"]
+
+    low = min(levels.min(), operator_level)
+    table = travel_time_table(max(levels.max(), operator_level) - low)
+    # Level-access distribution on the levels low..high
+    access = np.bincount(levels - low, weights=probabilities, minlength=len(table))
+    # P(|L1 - L2| = d) for two independent visits: autocorrelation of the access distribution
+    correlation = np.correlate(access, access, mode="full")
+    distance_probability = correlation[len(access) - 1:].copy()
+    distance_probability[1:] *= 2
+    between_trays = float(distance_probability @ table)
+    to_operator = float(probabilities @ table[np.abs(levels - operator_level)])
+
+    travel = between_trays + 2 * to_operator + 3 * ELEVATOR_PAUSE_AT_LEVEL_TIME
+    handling = 2 * config_dict["ELEVATOR_RETRIEVE_TIME"] + 2 * config_dict["ELEVATOR_RETURN_TIME"]
+    items_per_visit = items / visits
+    picking = items_per_visit * pick_time
+    visit_time = travel + handling + picking
+    return {
+        "items_per_visit": items_per_visit,
+        "travel_time": travel,
+        "lift_handling_time": handling,
+        "picking_time": picking,
+        "visit_time": visit_time,
+        "average_handling_time": visit_time / items_per_visit,
+        "throughput_items_per_hour": 3600 * items_per_visit / visit_time
+    }
+
+
+def layout_key(config_dict):
+    return json.dumps({key: value for key, value in config_dict.items() if key not in LIFT_PARAMETERS},
+                      sort_keys=True, default=str)
+
+
+def validate(config_paths, runs):
+    """ Estimates and simulates runs 0..runs-1 of every configuration and compares the throughput. """
+    simulation.USE_PRINT = False
+    rows = []
+    for config_path in config_paths:
+        config_dict = load_yaml(config_path)
+        config_dict["name"] = f"estimator_validation/{os.path.splitext(os.path.basename(config_path))[0]}"
+        if config_dict.get("AMOUNT_OF_ELEVATORS", 1) != 1 or config_dict.get("ORDER_ARRIVALS", False):
+            print(f"{config_path}: skipped, the estimate is for one lift with all orders available")
+            continue
+        set_config(config_dict)
+        initialize_result_files()
+        pick_time = picktime_mean()
+        estimates, simulated = [], []
+        for run_index in range(runs):
+            estimates.append(estimate_throughput(*layout_statistics(run_index), pick_time, config_dict))
+            set_config(config_dict)
+            simulated.append(simulation.run_simulation_once(run_index))
+        folder = os.path.join("main_result_output", config_dict["name"])
+        for base_filename in ["picking_times", "handling_times", "order_times", "summary"]:
+            merge_and_clean_jsonl_files(folder, base_filename)
+        estimate = np.mean([result["throughput_items_per_hour"] for result in estimates])
+        mean = np.mean([summary["throughput_items_per_hour"] for summary in simulated])
+        rows.append({
+            "config": config_path,
+            "runs": runs,
+            "estimated_items_per_hour": estimate,
+            "simulated_items_per_hour": mean,
+            "simulated_std": np.std([summary["throughput_items_per_hour"] for summary in simulated], ddof=1)
+            if runs > 1 else None,
+            "relative_error": (estimate - mean) / mean,
+            "estimated_items_per_visit": np.mean([result["items_per_visit"] for result in estimates]),
+        })
+    table = pd.DataFrame(rows)
+    print(table.to_string(index=False))
+    return table
+
+
+def screen(sweep_path, top=None, run_index=0):
+    """ Estimates the throughput of every scenario of a sweep, best first. """
+    sweep = load_yaml(sweep_path)
+    scenarios = build_scenarios(sweep)
+    changed_parameters = sorted({key for _, changed, _ in scenarios for key in changed})
+    layouts = {}
+    rows = []
+    start = time.perf_counter()
+    for scenario_name, _, config_dict in scenarios:
+        key = layout_key(config_dict)
+        if key not in layouts:
+            set_config(config_dict)
+            layouts[key] = layout_statistics(run_index)
+        set_config(config_dict)
+        result = estimate_throughput(*layouts[key], picktime_mean(), config_dict)
+        row = {"scenario": scenario_name}
+        row.update({parameter: config_dict.get(parameter) for parameter in changed_parameters})
+        row.update(result)
+        rows.append(row)
+
+    table = pd.DataFrame(rows).sort_values("throughput_items_per_hour", ascending=False)
+    folder = os.path.join("main_result_output", sweep["name"])
+    os.makedirs(folder, exist_ok=True)
+    table_path = os.path.join(folder, "screening.csv")
+    table.to_csv(table_path, index=False)
+    print(table.to_string(index=False))
+    print(f"{len(scenarios)} scenarios ({len(layouts)} layouts) estimated in {time.perf_counter() - start:.1f} s, "
+          f"saved to {table_path}")
+    if top:
+        print(f"Simulate first: {', '.join(table['scenario'].head(top))}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    validate_parser = subparsers.add_parser("validate")
+    validate_parser.add_argument("configs", nargs="+")
+    validate_parser.add_argument("--runs", type=int, default=5)
+    screen_parser = subparsers.add_parser("screen")
+    screen_parser.add_argument("sweep")
+    screen_parser.add_argument("--top", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "validate":
+        validate(args.configs, args.runs)
+    else:
+        screen(args.sweep, top=args.top)
+
+
+if __name__ == "__main__":
+    main()
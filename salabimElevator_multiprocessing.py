@@ -1,12 +1,19 @@
+import cProfile
 import glob
+import itertools
 import json
 import math
 import multiprocessing
 import os
-from collections import Counter
+import queue
+import sys
+import time
+import tracemalloc
+from collections import Counter, deque
 
 import numpy as np
 import salabim as sim
+from scipy import stats
 import yaml
 from types import SimpleNamespace
 import random
@@ -15,14 +22,27 @@ from tqdm import tqdm
 from numpy.random import default_rng
 from salabim import SimulationStopped
 
+try:
+    import resource  # not available on Windows, peak memory is then not reported
+except ImportError:
+    resource = None
+
 # To get the result of other python scripts
-from Dataverwerking_code.for_main.VerdelingBestellingen import get_inventory_and_orders
-from Dataverwerking_code.for_main.Tray_filling import get_tray_filling_from_data
+from Dataverwerking_code.for_main.VerdelingBestellingen import (
+    get_inventory_and_orders, get_order_stream, get_sku_vocabulary, OrderReleaseTimes
+)
+from Dataverwerking_code.for_main.Tray_filling import (
+    check_tray_filling, get_tray_filling_from_data, get_tray_filling_incremental
+)
 from Dataverwerking_code.for_main.Picktijden import generate_picktime_samples
+from Dataverwerking_code.for_main.Co_occurrentie import expected_tray_retrievals
+from Dataverwerking_code.for_main.Stage_cache import StageCache, file_fingerprint
+from Dataverwerking_code.for_main import VerdelingBestellingen
 
 ''' =============== Global parameters and variables =============== '''
 USE_PRINT = True
 # USE_ANIMATION = False     # No animation available
+ELEVATOR_PAUSE_AT_LEVEL_TIME = 2.0  # pause of the elevator after every move (also used by salabimElevator_estimator.py)
 
 def debug_print(*args, **kwargs):
     # use this instead of "print". it automatically checks if USE_PRINT is set or not
@@ -41,24 +61,68 @@ def load_config(filepath):
 # Adjustable parameters. Make a new YAML file if you want different configurations
 # All parameters are now in yaml files
 # Call with "config.<PARAMETER_NAME>"
+# A different file can be given on the command line: python salabimElevator_multiprocessing.py Configurations/X.yaml
 config = load_config("Configurations/base.yaml")
 
+
+def set_config(config_dict):
+    # Used as pool initializer and by run_with_config: worker processes import this file with the default config,
+    # this replaces it with the configuration of the parent (or of a sweep scenario)
+    global config
+    config = SimpleNamespace(**config_dict)
+
 event_log = []
 unfulfilled_requests = []
+reference_fillings = {}  # per worker process: reference inventory and tray layout for incremental repacking
+stage_cache = None  # per worker process, see run_stage
+sku_vocabulary = None  # item codes are indices in this vocabulary, only written as text in the output files
+stage_timer = None  # StageTimer of the current run
 
 ''' ====================== Classes ====================== '''
+class EventCounter:
+    """
+    Mixin that counts the events a component schedules (hold and activate) in env.scheduled_events, a measure of the
+    cost of a run that doesn't depend on the machine. Only used with COUNT_EVENTS (see component_class).
+    """
+    def hold(self, *args, **kwargs):
+        self.env.scheduled_events += 1
+        return super().hold(*args, **kwargs)
+
+    def activate(self, *args, **kwargs):
+        self.env.scheduled_events += 1
+        return super().activate(*args, **kwargs)
+
+
+counting_classes = {}  # component class -> its subclass with EventCounter
+
+
+def component_class(cls):
+    """
+    The component class to create: cls itself, or with COUNT_EVENTS (Benchmarks/scaling.py) a subclass that counts
+    its events. The subclass has the same name, so the components keep their salabim names.
+    """
+    if not getattr(config, "COUNT_EVENTS", False):
+        return cls
+    if cls not in counting_classes:
+        counting_classes[cls] = type(cls.__name__, (EventCounter, cls), {})
+    return counting_classes[cls]
+
+
 class Operator(sim.Component):
-    def setup(self, amount_of_items, requests, warehouse, elevator, elevator_done, run_index, np_rng=None):
+    def setup(self, amount_of_items, requests, warehouse, elevator, run_index, np_rng=None, pick_times=None,
+              arrivals=None):
         np_rng = np_rng or np.random.default_rng()
 
-        # picking time
-        self.pick_time = generate_picktime_samples(n=amount_of_items, np_rng=np_rng)
+        # picking time (can be given when they were already generated or loaded from the stage cache)
+        self.pick_time = pick_times if pick_times is not None else generate_picktime_samples(n=amount_of_items, np_rng=np_rng)
         self.pick_time_index = 0
         self.requests = requests
+        self.request_iterator = iter(requests)
+        self.arrivals = arrivals  # OrderArrival component, None when all orders are available from the start
         self.warehouse = warehouse
         self.elevator = elevator
-        self.elevator_done = elevator_done
         self.run_index = run_index
+        self.waiting_for_orders = False  # passive until OrderArrival releases a request
 
     def process(self):
         if config.AMOUNT_OF_ELEVATORS == 1:
@@ -70,6 +134,33 @@ class Operator(sim.Component):
 
         debug_print(f"\n\nOperator finished at time: {self.env.now()}")
 
+    def next_request(self):
+        """
+        Returns the next request to process (None when all requests are done).
+        With order arrivals, the operator is passive until the OrderArrival component released a request.
+        """
+        if self.arrivals is None:
+            return next(self.request_iterator, None)
+        while not self.arrivals.queue:
+            if self.arrivals.finished:
+                return None
+            wait_start = self.env.now()
+            self.waiting_for_orders = True
+            yield self.passivate()
+            self.waiting_for_orders = False
+            self.env.state_times["operator"]["waiting_for_orders"] += self.env.now() - wait_start
+        return self.arrivals.queue.popleft()
+
+    def use_elevator(self, task):
+        """
+        Gives the elevator a task (retrieveTray or returnTray) and stays passive until the elevator activates
+        the operator again when the task is done.
+        """
+        self.elevator.start_task(task, self)
+        wait_start = self.env.now()
+        yield self.passivate()
+        self.env.state_times["operator"]["waiting_on_elevator"] += self.env.now() - wait_start
+
     def one_elevator(self):
         # There are different preprocess strategies
         # 1: Orders stay the way they came in, items in an order are switched to put them in an optimal order
@@ -81,10 +172,14 @@ class Operator(sim.Component):
             None  # Placeholder
 
         # Process the requests. Each request is a list of items
-        for request_index, request in enumerate(self.requests):
+        for request_index in itertools.count():
+            request = yield from self.next_request()
+            if request is None:
+                break
             debug_print("\n\n============================= NEW ORDER =============================")
             # initialize global variables
             self.env.order_count += 1
+            order_start = self.env.now()
 
             # If future items can already be taken from a retrieved tray, it can be taken directly instead of sending
             # the tray back, just to call the same tray again.
@@ -100,7 +195,7 @@ class Operator(sim.Component):
                 self.env.request_start = self.env.now()
                 self.env.item_picking_times = []
 
-                debug_print(f"-------- {item_name.upper()} -------")
+                debug_print(f"-------- {item_name} -------")
                 # Retreive request information
                 debug_print(f"Processing the request: {item_name}\n")
 
@@ -118,17 +213,15 @@ class Operator(sim.Component):
                 # Let the elevator get the item.
                 debug_print(f"Task: Elevator will get {item_tray} with item: {item_name}")
                 self.elevator.setTarget(item_tray, item_name)
-                self.elevator.activate()
-
                 # wait until the elevator is back
-                self.elevator_done.reset()  # Reset the sim.State "elevator_done".
-                yield self.wait(self.elevator_done)  # Wait until elevator_done.set is called (in elevator process)
+                yield from self.use_elevator("retrieveTray")
                 debug_print(f"The tray with the item is in front of the operator at time {self.env.now():.2f}")
 
                 # Handle the item - Picking time
                 pick_time = self.pick_time[self.pick_time_index]  # placeholder; change with value from model
                 self.pick_time_index += 1
                 yield self.hold(pick_time)
+                self.env.state_times["operator"]["picking"] += pick_time
                 debug_print(f"Operator picked '{item_name}' from tray {item_tray.ID}")
                 debug_print(f"The operator finished picking the item at time {self.env.now():.2f}")
                 # The item is now gone from the tray
@@ -159,6 +252,7 @@ class Operator(sim.Component):
                         future_pick_time = self.pick_time[self.pick_time_index]
                         self.pick_time_index += 1
                         yield self.hold(future_pick_time)
+                        self.env.state_times["operator"]["picking"] += future_pick_time
                         self.warehouse.remove_item(item_name=future_name, tray_id=item_tray.ID)
                         item_counts[future_name] -= 1  # Decrease availability
                         processed_indices.add(j)  # Don't pick it again
@@ -174,14 +268,8 @@ class Operator(sim.Component):
                 # Press a button to return the tray. Elevator is activated again
                 debug_print(f"The operator pressed the elevator button at time {self.env.now():.2f}")
                 debug_print(f"The elevator will now return the tray to the warehouse")
-                self.elevator.switchTask()
-                self.elevator.activate()
-                # wait until the elevator is back
-                self.elevator_done.reset()
-                yield self.wait(self.elevator_done)
-
-                # The operator can handle the next request
-                self.elevator.switchTask()  # switches back to retrieveTray
+                # wait until the elevator is back, then the operator can handle the next request
+                yield from self.use_elevator("returnTray")
 
                 # Global throughput logic
                 self.env.request_stop = self.env.now()
@@ -196,10 +284,26 @@ class Operator(sim.Component):
                 # When items were handled in a batch, split the shared time
                 split_time = elapsed_time / len(self.env.item_picking_times)
                 for element in self.env.item_picking_times:
+                    self.env.histograms["item_handling_time"].record(element[1] + split_time)
                     log_time(item_code=element[0], request_index=request_index, time_value=element[1]+split_time, log_type="handling", run_index=self.run_index)
 
+            # Order completion: from the start of the order (or its arrival with ORDER_ARRIVALS) until it is finished
+            self.env.histograms["order_completion_time"].record(
+                self.env.now() - (request.release_time if request.release_time is not None else order_start))
+
+            if request.release_time is not None:
+                # Order latency: waiting in the queue and total time in the system
+                waiting_time = order_start - request.release_time
+                sojourn_time = self.env.now() - request.release_time
+                self.env.total_waiting_time += waiting_time
+                self.env.total_sojourn_time += sojourn_time
+                log_order_time(request_index, request.release_time, waiting_time, sojourn_time, self.run_index)
+
 
     def two_elevators(self):
+        if self.arrivals is not None:
+            raise Exception("\n\nOrder arrivals are only supported with 1 elevator\n\n")
+
         # Using 2 elevators, so the operator should look ahead at new trays to occupy the second elevator.
         # The elevators work as a pair, they don't work independently because of space restrictions,
         # meaning they can't go through each other
@@ -381,8 +485,37 @@ class Operator(sim.Component):
             i += 1
 
 
+class OrderArrival(sim.Component):
+    """
+    Releases the requests at their arrival time (see OrderReleaseTimes) into a queue the operator serves from (FIFO).
+    An operator that is waiting for orders is activated when a request arrives.
+    """
+    def setup(self, requests, release_times, operator):
+        self.requests = requests
+        self.release_times = release_times
+        self.operator = operator
+        self.queue = deque()
+        self.finished = False
+        self.max_queue_length = 0
+
+    def process(self):
+        for request in self.requests:
+            release_time = self.release_times.release_time(len(request.item_names))
+            if release_time > self.env.now():
+                yield self.hold(till=release_time)
+            request.release_time = self.env.now()
+            self.queue.append(request)
+            self.max_queue_length = max(self.max_queue_length, len(self.queue))
+            if self.operator.waiting_for_orders:
+                self.operator.activate()
+
+        self.finished = True
+        if self.operator.waiting_for_orders:
+            self.operator.activate()  # let the operator see there are no requests left
+
+
 class Elevator(sim.Component):
-    def setup(self, elevator_done):
+    def setup(self):
         self.current_level = 0
         self.task = "retrieveTray"  # retrieveTray: bring tray to operator | returnTray: return tray to original place
         self.empty = True;
@@ -402,12 +535,13 @@ class Elevator(sim.Component):
         # Only start when operator calls for it
         self.passivate()
         self.item = None
-        self.elevator_done = elevator_done
+        self.caller = None  # component that is activated when the current task is done
+        self.retrieve_duration = 0.0  # duration of the last retrieveTray, part of the lift cycle time
 
         #############################
         #Code Visualisatie
         self.y_position = config.BASE_Y + self.current_level * config.LEVEL_HEIGHT
-        self.pause_at_level_time = 2.0  # Tijd om even te pauzeren bij aankomst
+        self.pause_at_level_time = ELEVATOR_PAUSE_AT_LEVEL_TIME  # Tijd om even te pauzeren bij aankomst
 
         #############################
 
@@ -418,13 +552,13 @@ class Elevator(sim.Component):
         self.target_tray_number = target_tray.trayNumber  # is '0' or '1'
         self.item = item_name
 
-    def switchTask(self):
-        if self.task == "retrieveTray":
-            self.task = "returnTray"
-        elif self.task == "returnTray":
-            self.task = "retrieveTray"
-        else:
-            debug_print(f"\n\nERROR: Elevator task is unusual!\n\n")
+    def start_task(self, task, caller):
+        # Direct signalling: the caller passivates and is activated at the end of the task (see process)
+        if task not in ("retrieveTray", "returnTray"):
+            raise ValueError(f"Unknown elevator task: {task}")
+        self.task = task
+        self.caller = caller
+        self.activate()
 
     def retrieveTray(self):
         # Go to the target level, get or release the item(s)
@@ -439,6 +573,7 @@ class Elevator(sim.Component):
 
         # Retrieve the tray
         yield self.hold(self.retrieve_time)
+        self.env.state_times["elevator"]["retrieve"] += self.retrieve_time
         debug_print(f"Tray is loaded on elevator at time {self.env.now():.2f}")
         self.empty = False
         # Go to the operator
@@ -452,19 +587,23 @@ class Elevator(sim.Component):
 
         # Present the tray to the operator
         yield self.hold(self.present_time)
+        self.env.state_times["elevator"]["present"] += self.present_time
         debug_print(f"The tray is ready for the operator at time {self.env.now():.2f}\n")
+        self.retrieve_duration = self.env.now() - start_time
         self.empty = True
         # The operator will handle the item and press a button to call the elevator to return the tray
-        # The button is calling the function switchTask and restarts the process
+        # The button starts the returnTray task (see Operator.use_elevator)
 
 
     def returnTray(self):
         # The target tray variable should still be correct (it isn't changed in the meantime)
         start_time = self.env.now()
+        return_start = start_time
         start_loc = self.current_level
         self.empty = True;
-        # Put the tray back on the elevator
+        # Put the tray back on the elevator (takes as long as retrieving it, counted as retrieve)
         yield self.hold(self.retrieve_time)
+        self.env.state_times["elevator"]["retrieve"] += self.retrieve_time
         debug_print(f"\nTray is loaded on elevator at time {self.env.now():.2f}")
 
         # Go to the target level
@@ -478,8 +617,12 @@ class Elevator(sim.Component):
 
         # Return the tray into the warehouse
         yield self.hold(self.return_time)
+        self.env.state_times["elevator"]["return"] += self.return_time
         debug_print(f"Tray is returned to the warehouse at time {self.env.now():.2f}")
 
+        # Lift cycle: retrieving and returning the tray, without the time the tray spent at the operator
+        self.env.histograms["lift_cycle_time"].record(self.retrieve_duration + self.env.now() - return_start)
+
         # The lift can stay at its current location since there is only 1 elevator
 
 
@@ -490,13 +633,16 @@ class Elevator(sim.Component):
             yield from self.returnTray()
 
         # Let the operator know the elevator is finished
-        self.elevator_done.set()
+        self.caller.activate()
 
     #############################
     #Visualisatie Code
     #Tray smooth laten bewegen
     def move_to_level(self, target_level):
-        steps = 100
+        move_start = self.env.now()
+        # Every step is a scheduler event. This runner has no animation, so by default the trip is one hold
+        # (ELEVATOR_MOVE_STEPS: 100 gives the smooth movement of the animated version)
+        steps = getattr(config, "ELEVATOR_MOVE_STEPS", 1)
         start_level = self.current_level
         start_y = config.BASE_Y + start_level * config.LEVEL_HEIGHT
         end_y = config.BASE_Y + target_level * config.LEVEL_HEIGHT
@@ -511,6 +657,7 @@ class Elevator(sim.Component):
         self.y_position = end_y  # zorg dat eindpositie exact klopt
         yield self.hold(self.pause_at_level_time)  # korte pauze zichtbaar
         self.current_level = target_level
+        self.env.state_times["elevator"]["travel"] += self.env.now() - move_start
 
     #############################
 
@@ -554,6 +701,9 @@ class Warehouse:
         raise Exception(f"Item {item_name} not present in the warehouse.")
 
 class Tray:
+    # __slots__: no per-instance dict for the (many) trays, items and requests
+    __slots__ = ("ID", "level", "trayNumber", "items")
+
     def __init__(self, ID):
         self.ID = ID
         # There are 2 trays for each level
@@ -581,6 +731,8 @@ class Tray:
         raise Exception(f"Item '{item_name}' not found in Tray {self.ID}!")
 
 class Item:
+    __slots__ = ("name", "tray_ID")
+
     def __init__(self, name):
         self.name = name
         self.tray_ID = None
@@ -591,10 +743,15 @@ class Item:
     __repr__ = __str__  # Make repr use str
 
 class Request:
+    __slots__ = ("item_names", "release_time")
+
     def __init__(self, item_names):
         self.item_names = item_names  # The items that needs to be retrieved
+        self.release_time = None  # Set by OrderArrival when the order arrives
 
 class EventElevator:
+    __slots__ = ("item", "start_locatie", "start_tijd", "eind_locatie", "eind_tijd")
+
     def __init__(self, item: str, start_locatie: int, start_tijd: float, eind_locatie: int, eind_tijd: float):
         self.item = item
         self.start_locatie = start_locatie
@@ -622,17 +779,23 @@ def fill_warehouse_from_tray_items(tray_items, warehouse):
     for tray_id, items in tray_items.items():
         for item_data in items:
             item_id = item_data["item_id"]
-            warehouse.add_item(Item(name=str(item_id)), tray_id=tray_id)
+            warehouse.add_item(Item(name=item_id), tray_id=tray_id)
 
 
 def create_requests_from_grouped_orders(grouped_orders):
     requests = []
     for group in grouped_orders:
-        item_names = [str(item_id) for item_id in group]  # Zet ints om naar strings
+        item_names = np.asarray(group).tolist()  # Indices in sku_vocabulary, as Python ints
         requests.append(Request(item_names=item_names))
     return requests
 
 
+def stream_requests(grouped_orders):
+    """ Same as create_requests_from_grouped_orders, but only creates a Request when the operator needs it. """
+    for group in grouped_orders:
+        yield Request(item_names=np.asarray(group).tolist())
+
+
 def calculate_travel_time(start, end):
     """
     Time to travel a certain distance, according to 4 different trajectory shapes:
@@ -719,18 +882,19 @@ def calculate_travel_time(start, end):
     return t_j + t_a + t_v
 
 
-def initialize_result_files():
+def initialize_result_files(name=None):
     """
-    Clears or creates empty result files (JSONL and summary) for the given config.
+    Clears or creates empty result files (JSONL and summary) for the given config (default: the active config).
     Should be called once at the start of the simulation.
     """
-    folder_path = os.path.join("main_result_output", config.name)
+    folder_path = os.path.join("main_result_output", name or config.name)
     os.makedirs(folder_path, exist_ok=True)
 
     # List of files to reset
     files_to_clear = [
         "picking_times.jsonl",
         "handling_times.jsonl",
+        "order_times.jsonl",
         "summary.jsonl"
     ]
 
@@ -746,6 +910,7 @@ def log_time(item_code, request_index, time_value, log_type, run_index):
     JSONL because it is memory efficient: just add a new line each time. No need to load the whole file in memory
     useful for large datasets
     """
+    log_start = time.perf_counter()
     folder_path = os.path.join("main_result_output", config.name)
     os.makedirs(folder_path, exist_ok=True)
 
@@ -754,6 +919,9 @@ def log_time(item_code, request_index, time_value, log_type, run_index):
 
     key_name = f"{log_type}_time"  # either 'picking_time' or 'handling_time'
 
+    if sku_vocabulary is not None:
+        item_code = sku_vocabulary.decode_one(item_code)
+
     with open(log_path, "a") as f:
         json.dump({
             "item_code": item_code,
@@ -762,10 +930,36 @@ def log_time(item_code, request_index, time_value, log_type, run_index):
         }, f)
         f.write("\n")
 
+    if stage_timer is not None:
+        stage_timer.add("logging", time.perf_counter() - log_start)
+
+
+def log_order_time(request_index, release_time, waiting_time, sojourn_time, run_index):
+    """
+    Logs the arrival, waiting time (until the operator starts the order) and sojourn time (arrival until the order is
+    finished) of an order to a JSONL file inside the config-specific folder.
+    """
+    log_start = time.perf_counter()
+    folder_path = os.path.join("main_result_output", config.name)
+    os.makedirs(folder_path, exist_ok=True)
+
+    with open(os.path.join(folder_path, f"order_times_run{run_index}.jsonl"), "a") as f:
+        json.dump({
+            "request_index": request_index,
+            "release_time": release_time,
+            "waiting_time": waiting_time,
+            "sojourn_time": sojourn_time
+        }, f)
+        f.write("\n")
+
+    if stage_timer is not None:
+        stage_timer.add("logging", time.perf_counter() - log_start)
+
 
-def write_summary(average_picking_time, average_handling_time, throughput_items_per_hour, total_orders, total_items, run_index):
+def write_summary(average_picking_time, average_handling_time, throughput_items_per_hour, total_orders, total_items, run_index, extra=None):
     """
     Appends summary metrics as a JSON line to summary.jsonl in the config-specific output folder.
+    Additional metrics can be given as a dict in "extra".
     """
     folder_path = os.path.join("main_result_output", config.name)
     os.makedirs(folder_path, exist_ok=True)
@@ -778,6 +972,7 @@ def write_summary(average_picking_time, average_handling_time, throughput_items_
         "total_items": total_items,
         "run_index": run_index
     }
+    summary_data.update(extra or {})
 
     summary_path = os.path.join(folder_path, f"summary_run{run_index}.jsonl")
     with open(summary_path, "w") as f:  # Use "w" since it's per-run and won't be reused
@@ -785,6 +980,414 @@ def write_summary(average_picking_time, average_handling_time, throughput_items_
         f.write("\n")
 
     debug_print(f"Summary appended to {summary_path}")
+    return summary_data
+
+
+def peak_rss_mb():
+    """ Peak resident memory of this process (MB), None when it can not be measured. """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 ** 2 if sys.platform == "darwin" else max_rss / 1024  # bytes on macOS, KB on Linux
+
+
+def available_memory_mb():
+    """ Memory that can be used without swapping (MB), None when it can not be measured. """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+TRACEMALLOC_TOP_SITES = 10
+
+
+class StageTimer:
+    """
+    Wall-clock time per stage of a run. Stages run one after the other: starting a stage stops the previous one.
+    Time added with add() while a stage runs (e.g. logging during the simulation) is subtracted from that stage,
+    so the stage times add up to the duration of the run.
+    With a profile_folder every stage also runs under cProfile and is dumped to <profile_folder>/<stage>.prof.
+    A stage that runs more than once (model_setup) keeps one profiler, so its .prof has the stats of every part.
+    The peak RSS of the process after every stage is kept in peak_rss. With trace_allocations, tracemalloc keeps
+    the peak traced memory of every stage and the source lines that allocated the most memory during it.
+    """
+    def __init__(self, profile_folder=None, trace_allocations=False):
+        self.times = {}
+        self.peak_rss = {}
+        self.allocations = {}
+        self.profile_folder = profile_folder
+        self.trace_allocations = trace_allocations
+        self.current = None
+        self.started = 0.0
+        self.nested = 0.0
+        self.profiler = None
+        self.profilers = {}  # stage -> cProfile.Profile, reused when a stage runs again
+        self.snapshot = None
+        if profile_folder:
+            os.makedirs(profile_folder, exist_ok=True)
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self, stage):
+        self.stop()
+        self.current = stage
+        self.nested = 0.0
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            self.snapshot = tracemalloc.take_snapshot()
+        if self.profile_folder:
+            self.profiler = self.profilers.setdefault(stage, cProfile.Profile())
+            self.profiler.enable()
+        self.started = time.perf_counter()
+
+    def stop(self):
+        if self.current is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.disable()
+            # the stats of all parts of the stage so far, a later part overwrites the file with a superset
+            self.profiler.dump_stats(os.path.join(self.profile_folder, f"{self.current}.prof"))
+            self.profiler = None
+        self.times[self.current] = self.times.get(self.current, 0.0) + elapsed - self.nested
+        self.peak_rss[self.current] = peak_rss_mb()
+        if self.trace_allocations:
+            self.record_allocations()
+        self.current = None
+
+    def record_allocations(self):
+        _, peak = tracemalloc.get_traced_memory()
+        ignore_tracemalloc = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        differences = tracemalloc.take_snapshot().filter_traces(ignore_tracemalloc).compare_to(
+            self.snapshot.filter_traces(ignore_tracemalloc), "lineno")
+        self.snapshot = None
+        stage = self.allocations.setdefault(self.current, {"peak_traced_mb": 0.0, "top_sites": []})
+        stage["peak_traced_mb"] = max(stage["peak_traced_mb"], peak / 1024 ** 2)
+        # a stage that runs more than once (model_setup) keeps the sites of every part
+        stage["top_sites"] += [
+            {"site": f"{difference.traceback[0].filename}:{difference.traceback[0].lineno}",
+             "size_mb": difference.size_diff / 1024 ** 2, "count": difference.count_diff}
+            for difference in differences[:TRACEMALLOC_TOP_SITES] if difference.size_diff > 0
+        ]
+        stage["top_sites"].sort(key=lambda site: site["size_mb"], reverse=True)
+        del stage["top_sites"][TRACEMALLOC_TOP_SITES:]
+
+    def add(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+        if self.current is not None:
+            self.nested += seconds
+
+    def close(self):
+        self.stop()
+        if self.trace_allocations:
+            tracemalloc.stop()
+
+
+class RunningStatistic:
+    """
+    Mean and variance of a metric over runs, updated one value at a time (Welford's algorithm),
+    so the parent process never has to keep or reload all run results.
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0   # sum of squared differences from the mean
+
+    def add(self, value):
+        value = float(value)
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float("nan")
+
+    def half_width(self, confidence=0.95):
+        """ Half-width of the confidence interval of the mean (Student t). """
+        if self.n < 2:
+            return float("nan")
+        return float(stats.t.ppf(0.5 + confidence / 2, self.n - 1) * math.sqrt(self.variance() / self.n))
+
+    def to_dict(self, confidence=0.95):
+        half_width = self.half_width(confidence)
+        return {
+            "n": self.n,
+            "mean": self.mean,
+            "std": math.sqrt(self.variance()) if self.n > 1 else float("nan"),
+            "ci_low": self.mean - half_width,
+            "ci_high": self.mean + half_width,
+            "half_width": half_width,
+            "confidence": confidence
+        }
+
+
+class LogLinearHistogram:
+    """
+    HDR-style histogram: every power of two is split in sub_buckets linear buckets, so the relative error of a
+    percentile is at most 1 / (2 * sub_buckets) over the whole range (1.6% with 32 sub-buckets).
+    Recording is one frexp and a dict update. Histograms of different runs are merged by adding the counts.
+    """
+    def __init__(self, sub_buckets=32, counts=None):
+        self.sub_buckets = sub_buckets
+        self.counts = counts or {}  # bucket index -> count, values <= 0 are counted in bucket None
+        self.total = sum(self.counts.values())
+
+    def record(self, value):
+        if value > 0:
+            mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+            index = exponent * self.sub_buckets + int((mantissa - 0.5) * 2 * self.sub_buckets)
+        else:
+            index = None
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+
+    def bucket_value(self, index):
+        """ Middle of a bucket. """
+        if index is None:
+            return 0.0
+        exponent, sub_bucket = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub_bucket + 0.5) / (2 * self.sub_buckets), exponent)
+
+    def percentile(self, q):
+        if not self.total:
+            return float("nan")
+        rank = q / 100 * self.total
+        seen = self.counts.get(None, 0)
+        if seen >= rank:
+            return 0.0
+        for index in sorted(i for i in self.counts if i is not None):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self.bucket_value(index)
+        return self.bucket_value(max(i for i in self.counts if i is not None))
+
+    def percentiles(self, qs=(50, 90, 99)):
+        return {f"p{q}": self.percentile(q) for q in qs}
+
+    def to_dict(self):
+        # JSON keys are strings, "zero" for values <= 0
+        return {"sub_buckets": self.sub_buckets,
+                "counts": {("zero" if index is None else str(index)): count for index, count in self.counts.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = {(None if index == "zero" else int(index)): count for index, count in data["counts"].items()}
+        return cls(data["sub_buckets"], counts)
+
+
+class RunAggregator:
+    """ Online aggregate of the run summaries, one RunningStatistic per metric. """
+    METRICS = ["average_picking_time", "average_handling_time", "throughput_items_per_hour",
+               "average_waiting_time", "average_sojourn_time"]
+
+    def __init__(self, metrics=None, antithetic=False):
+        self.statistics = {metric: RunningStatistic() for metric in (metrics or self.METRICS)}
+        # With antithetic pairs, runs 2k and 2k+1 are not independent: only the mean of a pair is one observation
+        self.antithetic = antithetic
+        self.unpaired = {}
+        self.histograms = {}  # merged latency histograms of all runs
+
+    def add(self, summary):
+        for name, data in (summary.get("histograms") or {}).items():
+            histogram = LogLinearHistogram.from_dict(data)
+            if name in self.histograms:
+                self.histograms[name].merge(histogram)
+            else:
+                self.histograms[name] = histogram
+
+        # Utilization fractions depend on the model (e.g. waiting_for_orders), they get a statistic when first seen
+        for metric in summary:
+            if metric.endswith("_fraction") and metric not in self.statistics:
+                self.statistics[metric] = RunningStatistic()
+
+        if self.antithetic:
+            pair_index = summary["run_index"] // 2
+            partner = self.unpaired.pop(pair_index, None)
+            if partner is None:
+                self.unpaired[pair_index] = summary
+                return
+            summary = {metric: (summary[metric] + partner[metric]) / 2 for metric in self.statistics
+                       if summary.get(metric) is not None and partner.get(metric) is not None}
+
+        for metric, statistic in self.statistics.items():
+            if summary.get(metric) is not None:
+                statistic.add(summary[metric])
+
+    def to_dict(self, confidence=0.95):
+        # Metrics that no run reported (e.g. order latency without ORDER_ARRIVALS) are left out
+        return {metric: statistic.to_dict(confidence) for metric, statistic in self.statistics.items() if statistic.n}
+
+    def latency_percentiles(self):
+        """ Percentiles of the merged latency histograms, e.g. {"lift_cycle_time": {"p50": ..., ...}}. """
+        return {name: histogram.percentiles() for name, histogram in self.histograms.items()}
+
+    def relative_half_width(self, metric, confidence=0.95):
+        statistic = self.statistics[metric]
+        if statistic.n < 2 or statistic.mean == 0:
+            return float("inf")
+        return statistic.half_width(confidence) / abs(statistic.mean)
+
+    def write(self, folder, confidence=0.95, info=None):
+        """ Writes the final aggregate with confidence intervals to aggregate.json in the output folder. """
+        aggregate = self.to_dict(confidence)
+        if self.histograms:
+            aggregate["latency_percentiles"] = self.latency_percentiles()  # not a metric: no mean or interval
+        if info:
+            aggregate["run_info"] = info
+        aggregate_path = os.path.join(folder, "aggregate.json")
+        with open(aggregate_path, "w") as f:
+            json.dump(aggregate, f, indent=4)
+        return aggregate_path
+
+
+def measured_call(function, task):
+    """ Runs function(task) in the probe worker of a SimulationPool, also returns the peak RSS of the worker (MB). """
+    return function(task), peak_rss_mb()
+
+
+class SimulationPool:
+    """
+    Process pool for simulation runs with at most as many workers as fit in the available memory.
+    Every worker keeps its memory (imports, Excel and stage caches) between runs, so the amount of workers has to be
+    limited, not only the amount of runs in flight.
+    With memory_fraction, the first task runs alone in a fresh probe worker. Its peak RSS after that one run is the
+    memory a worker needs, the pool then gets at most memory_fraction * available memory / that peak workers (and at
+    most "processes"). Without memory_fraction, or where the RSS can't be measured, the pool gets "processes" workers.
+    """
+    def __init__(self, processes=None, memory_fraction=None, initializer=None, initargs=()):
+        self.processes = processes or os.cpu_count()
+        self.memory_fraction = memory_fraction
+        self.initializer = initializer
+        self.initargs = initargs
+        self.worker_memory = None  # peak RSS of the probe worker (MB)
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.terminate()
+
+    def start(self, function, first_task):
+        """ Starts the pool. Returns [function(first_task)] when it ran in the probe worker, else []. """
+        results = []
+        if self.memory_fraction is not None and resource is not None:
+            with multiprocessing.Pool(1, self.initializer, self.initargs) as probe:
+                result, self.worker_memory = probe.apply(measured_call, (function, first_task))
+            results.append(result)
+            available = available_memory_mb()
+            if self.worker_memory and available is not None:
+                fitting = int(self.memory_fraction * available / self.worker_memory)
+                self.processes = max(1, min(self.processes, fitting))
+        self.pool = multiprocessing.Pool(self.processes, self.initializer, self.initargs)
+        return results
+
+    def imap_unordered(self, function, tasks):
+        tasks = list(tasks)
+        if self.pool is None and tasks:
+            first_results = self.start(function, tasks[0])
+            yield from first_results
+            tasks = tasks[len(first_results):]
+        yield from self.pool.imap_unordered(function, tasks)
+
+    def map(self, function, tasks):
+        tasks = list(tasks)
+        results = []
+        if self.pool is None and tasks:
+            results = self.start(function, tasks[0])
+        return results + self.pool.map(function, tasks[len(results):], chunksize=1)
+
+
+def dispatch_runs(pool, aggregator, num_runs, target=None, metric="throughput_items_per_hour",
+                  min_runs=10, max_seconds=None, progress=None):
+    """
+    Dispatches runs 0, 1, 2, ... to a SimulationPool, at most one per worker at the same time, and aggregates every
+    result.
+    - Fixed mode (target is None): exactly num_runs runs.
+    - Sequential mode: keeps dispatching until the relative half-width of the 95% CI of "metric" is at most
+      "target" (after at least min_runs runs), or the budget is exhausted (num_runs runs or max_seconds).
+      Runs that are still busy when the target is reached are finished and included.
+    min_runs, num_runs and the returned "runs" count runs, also when the aggregator averages antithetic pairs into
+    one observation.
+    Returns a dict describing why the runs stopped.
+    """
+    results = queue.Queue()
+    start_time = time.perf_counter()
+    next_index = 0
+    in_flight = 0
+    completed = 0
+    reason = "fixed amount of runs"
+    max_in_flight = 0
+
+    def precision_reached():
+        return (target is not None and completed >= min_runs
+                and aggregator.relative_half_width(metric) <= target)
+
+    def may_dispatch():
+        nonlocal reason
+        if next_index >= num_runs:
+            if target is not None and reason != "precision target reached":
+                reason = "run budget exhausted"
+            return False
+        if precision_reached():
+            reason = "precision target reached"
+            return False
+        if max_seconds is not None and time.perf_counter() - start_time > max_seconds:
+            reason = "time budget exhausted"
+            return False
+        return True
+
+    if pool.pool is None and may_dispatch():
+        for summary in pool.start(run_simulation_once, next_index):  # run 0 in the probe worker
+            next_index += 1
+            completed += 1
+            aggregator.add(summary)
+            if progress is not None:
+                progress.update()
+
+    while True:
+        while in_flight < pool.processes and may_dispatch():
+            pool.pool.apply_async(run_simulation_once, (next_index,), callback=results.put, error_callback=results.put)
+            next_index += 1
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        if in_flight == 0:
+            break
+
+        summary = results.get()
+        in_flight -= 1
+        if isinstance(summary, BaseException):
+            raise summary
+        completed += 1
+        aggregator.add(summary)
+        if progress is not None:
+            progress.update()
+
+    return {
+        "runs": completed,
+        "stop_reason": reason,
+        "target_relative_half_width": target,
+        "relative_half_width": aggregator.relative_half_width(metric),
+        "wall_seconds": time.perf_counter() - start_time,
+        "processes": pool.processes,
+        "max_in_flight": max_in_flight,
+        "worker_peak_rss_mb": pool.worker_memory
+    }
 
 
 def merge_and_clean_jsonl_files(folder, base_filename):
@@ -812,24 +1415,174 @@ def merge_summary_files(folder):
                     out_f.write(line)
 
 
-# start with empty logging files
-initialize_result_files()
+def run_stage(stage, key_parts, compute, generators=()):
+    """
+    Runs a deterministic pipeline stage through the content-addressed stage cache (if STAGE_CACHE is enabled).
+    key_parts must contain every input of the stage, the random generators it uses are added to the key automatically.
+    """
+    global stage_cache
+    if not getattr(config, "STAGE_CACHE", False):
+        return compute()
+    if stage_cache is None:
+        stage_cache = StageCache(getattr(config, "STAGE_CACHE_FOLDER", "stage_cache"),
+                                 max_bytes=getattr(config, "STAGE_CACHE_MAX_MB", 2048) * 1024 ** 2)
+    # The same generator can be given twice (one stream for everything), only keep it once
+    unique_generators = list({id(generator): generator for generator in generators}.values())
+    return stage_cache.run(stage, key_parts, compute, generators=unique_generators)
+
+
+def warehouse_tray_count():
+    # Warehouse.add_item only accepts tray ids 0..WAREHOUSE_HEIGHT * TRAYS_PER_ROW - 1
+    return config.WAREHOUSE_HEIGHT * config.TRAYS_PER_ROW
+
+
+def get_multistart_options():
+    # Options for the multi-start random filling (TRAY_FILLING_MODE 5). Not every YAML file has them, so use defaults
+    return {
+        "starts": getattr(config, "MULTISTART_STARTS", 8),
+        "objective": getattr(config, "MULTISTART_OBJECTIVE", "trays"),
+        "time_budget": getattr(config, "MULTISTART_TIME_BUDGET", None),
+        "trays_per_row": config.TRAYS_PER_ROW,
+        "operator_level": config.OPERATOR_LEVEL  # for the "travel" objective
+    }
+
+
+def fill_trays(inventory_list, rng):
+    """
+    Tray filling stage (TRAY_FILLING_MODE), loaded from the stage cache when possible.
+    The layout doesn't depend on the size of the warehouse, so scenarios that only change WAREHOUSE_HEIGHT share the
+    cache entry. Whether the trays exist in this warehouse is checked on the cached or computed layout.
+    """
+    multistart = get_multistart_options()
+    tray_items = run_stage(
+        "tray_filling",
+        (inventory_list, config.TRAY_FILLING_MODE, config.tray_length, config.tray_width, config.max_trays,
+         multistart,
+         sku_vocabulary.codes if sku_vocabulary is not None else None,  # meaning of the item indices
+         file_fingerprint("Dataverwerking_code/Dataverwerking_data_Input/*.xlsx",
+                          "Dataverwerking_code/Dataverwerking_data_output/item_dims.json",
+                          "Dataverwerking_code/Dataverwerking_data_output/grouped_orders.csv",
+                          "Dataverwerking_code/for_main/Tray_filling.py",
+                          "Dataverwerking_code/for_main/Co_occurrentie.py",
+                          "Dataverwerking_code/for_main/Sku_vocabulary.py")),
+        lambda: get_tray_filling_from_data(inventory_list, config.TRAY_FILLING_MODE, config.tray_length,
+                                           config.tray_width, config.max_trays, rng=rng, multistart=multistart,
+                                           vocabulary=sku_vocabulary),
+        generators=[rng])
+    check_tray_filling(tray_items, config.tray_length, config.tray_width, warehouse_tray_count())
+    return tray_items
+
+
+RANDOM_STREAMS = ["orders", "augmentation", "order_sizes", "tray_filling", "picktimes", "arrivals"]
+
+
+def make_random_streams(run_index):
+    """
+    Independent, named random streams for one run, spawned from SeedSequence(run_index).
+    Each stream is a (random.Random, numpy Generator) pair. Because every part of the model draws from its own
+    stream, changing one part (e.g. TRAY_FILLING_MODE) doesn't shift the numbers of the others: compared scenarios
+    use common random numbers.
+    With ANTITHETIC_PICKTIMES, runs 2k and 2k+1 share all streams and run 2k+1 uses the antithetic picking times.
+
+    Returns:
+    - streams: dict of stream name -> (random.Random, numpy Generator)
+    - antithetic: argument for generate_picktime_samples (None when antithetic pairs are not used)
+    """
+    seed, antithetic = run_index, None
+    if getattr(config, "ANTITHETIC_PICKTIMES", False):
+        seed, antithetic = run_index // 2, run_index % 2 == 1
+
+    streams = {}
+    for name, child in zip(RANDOM_STREAMS, np.random.SeedSequence(seed).spawn(len(RANDOM_STREAMS))):
+        python_sequence, numpy_sequence = child.spawn(2)
+        streams[name] = (random.Random(int(python_sequence.generate_state(1, np.uint64)[0])),
+                         np.random.default_rng(numpy_sequence))
+    return streams, antithetic
+
+
+def get_reference_filling():
+    """
+    Inventory and tray layout of a fixed reference run (INCREMENTAL_REFERENCE_SEED), computed once per worker.
+    Every run repacks incrementally from this reference, so a run's layout only depends on its own seed and not on
+    which runs the worker happened to do before.
+    """
+    seed = getattr(config, "INCREMENTAL_REFERENCE_SEED", 0)
+    key = (config.name, seed, config.hours, config.TRAY_FILLING_MODE, config.tray_length, config.tray_width, config.max_trays)
+    if key not in reference_fillings:
+        rng = random.Random(seed)
+        np_rng = np.random.default_rng(seed=seed)
+        _, inventory_list, _ = get_inventory_and_orders(config.hours, rng=rng, np_rng=np_rng)
+        tray_items = fill_trays(inventory_list, rng)
+        reference_fillings[key] = (inventory_list, tray_items)
+    return reference_fillings[key]
+
 
 ''' ====================== MAIN ====================== '''
 def run_simulation_once(run_index):
-    rng = random.Random(run_index)  # For Python stdlib random
-    np_rng = np.random.default_rng(seed=run_index)  # For NumPy and scipy
+    global sku_vocabulary, stage_timer
+    # Wall-clock time per stage in the summary, PROFILE_RUN_INDEX also profiles every stage of that run
+    profile_folder = None
+    if getattr(config, "PROFILE_RUN_INDEX", None) == run_index:
+        profile_folder = os.path.join("main_result_output", config.name, f"profile_run{run_index}")
+    # TRACEMALLOC_RUN_INDEX keeps the top allocation sites per stage of that run (tracemalloc makes the run slower)
+    stage_timer = StageTimer(profile_folder,
+                             trace_allocations=getattr(config, "TRACEMALLOC_RUN_INDEX", None) == run_index)
+
+    stage_timer.start("excel_loading")  # only the first run of a worker process reads the Excel files
+    sku_vocabulary = get_sku_vocabulary()
+
+    if getattr(config, "COMMON_RANDOM_NUMBERS", True):
+        streams, antithetic = make_random_streams(run_index)
+    else:
+        # One stream for everything
+        rng = random.Random(run_index)  # For Python stdlib random
+        np_rng = np.random.default_rng(seed=run_index)  # For NumPy and scipy
+        streams, antithetic = {name: (rng, np_rng) for name in RANDOM_STREAMS}, None
 
     # Create the orders, inventory and fill the trays
-    order_list, inventory_list, grouped_orders = get_inventory_and_orders(config.hours, rng=rng, np_rng=np_rng)
-    tray_items = get_tray_filling_from_data(inventory_list, config.TRAY_FILLING_MODE, config.tray_length,
-                                            config.tray_width, config.max_trays)
+    # Each stage is loaded from the stage cache when its inputs (and random state) did not change
+    stage_timer.start("orders")
+    if getattr(config, "STREAM_ORDERS", False):
+        # Only the inventory counts are kept, the orders are generated while the operator processes them
+        amount_of_items, inventory_list, order_stream, hourly_counts = get_order_stream(
+            config.hours, rng=streams["orders"][0], np_rng=streams["orders"][1],
+            augmentation_rng=streams["augmentation"][1], order_size_rng=streams["order_sizes"][1])
+    else:
+        order_generators = [streams["orders"][0], streams["orders"][1], streams["augmentation"][1],
+                            streams["order_sizes"][1]]
+        order_list, inventory_list, grouped_orders = run_stage(
+            "orders",
+            (config.hours, VerdelingBestellingen.OVERFILL_PERCENTAGE,
+             file_fingerprint("Dataverwerking_code/Dataverwerking_data_Input/*.xlsx",
+                              "Dataverwerking_code/simulatie_parameters.json",
+                              "Dataverwerking_code/for_main/VerdelingBestellingen.py",
+                              "Dataverwerking_code/for_main/Sku_vocabulary.py")),
+            lambda: get_inventory_and_orders(config.hours, rng=streams["orders"][0], np_rng=streams["orders"][1],
+                                             augmentation_rng=streams["augmentation"][1],
+                                             order_size_rng=streams["order_sizes"][1]),
+            generators=order_generators)
+        amount_of_items = sum(len(items) for items in order_list.values())
+        hourly_counts = [len(items) for items in order_list.values()]
+        order_stream = lambda: grouped_orders
+    stage_timer.start("tray_filling")
+    repack_info = None
+    if getattr(config, "INCREMENTAL_REPACKING", False):
+        # Only repack the trays affected by the difference with the reference inventory
+        reference_inventory, reference_tray_items = get_reference_filling()
+        tray_items, repack_info = get_tray_filling_incremental(
+            reference_tray_items, reference_inventory, inventory_list, config.tray_length, config.tray_width,
+            fragmentation_threshold=getattr(config, "INCREMENTAL_FRAGMENTATION_THRESHOLD", 0.35),
+            vocabulary=sku_vocabulary, tray_count=warehouse_tray_count())
+    else:
+        tray_items = fill_trays(inventory_list, streams["tray_filling"][0])
 
+    stage_timer.start("model_setup")
     # Variables to calculate the throughput of the system. Divide the total time and count to get the average time per item
     # Easily calculate items per hour using: 3600 / average_time
     # Splitting shared time (= lift movement) between items that were handled as a batch from the same tray is acceptable
     # Since we're working with averages, the values can be added to each run to get a global average (if needed)
     env = sim.Environment(trace=False)  # Create the simulation environment
+    env.scheduled_events = 0  # counted by the components with COUNT_EVENTS (EventCounter)
 
     # for average pick time
     env.total_picking_time = 0.0
@@ -843,22 +1596,54 @@ def run_simulation_once(run_index):
     env.item_count = 0
     env.order_count = 0
 
-    # Create a state to help with synchronization
-    elevator_done = sim.State('elevator_done')
+    # time per state of the elevator and the operator, the rest of the simulated time is idle
+    # (the elevator times are summed over all elevators)
+    env.state_times = {
+        "elevator": {"travel": 0.0, "retrieve": 0.0, "present": 0.0, "return": 0.0},
+        "operator": {"picking": 0.0, "waiting_on_elevator": 0.0, "waiting_for_orders": 0.0}
+    }
+
+    # latency distributions (percentiles in the summary)
+    env.histograms = {name: LogLinearHistogram() for name in ["item_handling_time", "order_completion_time", "lift_cycle_time"]}
+
+    # for order latency (ORDER_ARRIVALS)
+    env.total_waiting_time = 0.0
+    env.total_sojourn_time = 0.0
 
     # Create the components
     warehouse = Warehouse(config.WAREHOUSE_HEIGHT)
     fill_warehouse_from_tray_items(tray_items, warehouse)
-    requests = create_requests_from_grouped_orders(grouped_orders)
+    if getattr(config, "STREAM_ORDERS", False):
+        requests = stream_requests(order_stream())
+    else:
+        requests = create_requests_from_grouped_orders(grouped_orders)
 
     # Create an Operator and give it the necessary objects
     # The operator is the only Component that executes its process method from the start
-    amount_of_items = sum(len(items) for items in order_list.values())
-    elevator = Elevator(env=env, elevator_done=elevator_done)
+    picktime_rng = streams["picktimes"][1]
+    stage_timer.start("picktimes")
+    pick_times = run_stage(
+        "picktimes",
+        (amount_of_items, antithetic,
+         file_fingerprint("Dataverwerking_code/PicktijdenBerekening_IQR/*_picktijden_IQR.csv",
+                          "Dataverwerking_code/for_main/Picktijden.py")),
+        lambda: generate_picktime_samples(n=amount_of_items, np_rng=picktime_rng, antithetic=antithetic),
+        generators=[picktime_rng])
+    stage_timer.start("model_setup")
+    elevator = component_class(Elevator)(env=env)
     if config.AMOUNT_OF_ELEVATORS == 2:
-        elevator_2 = Elevator(env=env)
-    operator = Operator(env=env, amount_of_items=amount_of_items, requests=requests, warehouse=warehouse, elevator=elevator, elevator_done=elevator_done, run_index=run_index, np_rng=np_rng)
-
+        elevator_2 = component_class(Elevator)(env=env)
+    order_arrivals = getattr(config, "ORDER_ARRIVALS", False)
+    operator = component_class(Operator)(env=env, amount_of_items=amount_of_items, requests=[] if order_arrivals else requests, warehouse=warehouse, elevator=elevator, run_index=run_index, np_rng=picktime_rng, pick_times=pick_times)
+    arrivals = None
+    if order_arrivals:
+        # The orders arrive over time and wait in a queue, the operator takes them in order of arrival
+        release_times = OrderReleaseTimes(hourly_counts, np_rng=streams["arrivals"][1],
+                                          rate_factor=getattr(config, "ARRIVAL_RATE_FACTOR", 1.0))
+        arrivals = component_class(OrderArrival)(env=env, requests=requests, release_times=release_times, operator=operator)
+        operator.arrivals = arrivals
+
+    stage_timer.start("simulation")
     try:
         env.run()
     except SimulationStopped:
@@ -873,7 +1658,60 @@ def run_simulation_once(run_index):
     average_picking_time = env.total_picking_time / env.picking_count
     average_item_time = env.total_handling_time / env.item_count
     item_throughput = 3600 / average_item_time  # items per hour
-    write_summary(average_picking_time, average_item_time, item_throughput, env.order_count, env.item_count, run_index)
+    # Distinct trays per order for this layout (lower = fewer lift trips), before = the bin packing layout (mode 1)
+    # of the same inventory, so every run compares the filling mode against mode 1 on its own orders
+    retrievals_after = expected_tray_retrievals(order_stream(), tray_items)
+    if config.TRAY_FILLING_MODE == 1 and repack_info is None:
+        retrievals_before = retrievals_after
+    else:
+        bin_packing_tray_items = get_tray_filling_from_data(inventory_list, 1, config.tray_length, config.tray_width,
+                                                            config.max_trays, validate=False, vocabulary=sku_vocabulary)
+        retrievals_before = expected_tray_retrievals(order_stream(), bin_packing_tray_items)
+    extra = {
+        "expected_tray_retrievals_per_order": retrievals_after,
+        "expected_tray_retrievals_per_order_bin_packing": retrievals_before
+    }
+    if getattr(config, "COUNT_EVENTS", False):
+        # Events scheduled by the components (cost of the simulation, independent of the machine)
+        extra["simulation_events"] = env.scheduled_events
+    for name, histogram in env.histograms.items():
+        for percentile, value in histogram.percentiles().items():
+            extra[f"{name}_{percentile}"] = value
+    extra["histograms"] = {name: histogram.to_dict() for name, histogram in env.histograms.items()}
+    # Utilization: fraction of the simulated time per state (shows whether the lift or the picker is the bottleneck)
+    # With more elevators, their summed time is divided by the elevator time available: the average per elevator
+    amount_per_component = {"elevator": config.AMOUNT_OF_ELEVATORS, "operator": 1}
+    for component, state_times in env.state_times.items():
+        available_time = env.now() * amount_per_component[component]
+        state_times["idle"] = max(available_time - sum(state_times.values()), 0.0)
+        for state, state_time in state_times.items():
+            extra[f"{component}_{state}_fraction"] = float(state_time / available_time) if available_time else 0.0
+    extra["state_times"] = {component: {state: float(state_time) for state, state_time in state_times.items()}
+                            for component, state_times in env.state_times.items()}
+    if arrivals is not None:
+        rate_factor = getattr(config, "ARRIVAL_RATE_FACTOR", 1.0)
+        extra["arrival_rate_factor"] = rate_factor
+        extra["average_waiting_time"] = env.total_waiting_time / env.order_count
+        extra["average_sojourn_time"] = env.total_sojourn_time / env.order_count
+        extra["max_queue_length"] = arrivals.max_queue_length
+        # Offered load vs. what the VLM delivered: when the VLM saturates, the realized throughput stays behind
+        extra["offered_items_per_hour"] = amount_of_items / (config.hours / rate_factor)
+        extra["realized_items_per_hour"] = env.item_count / (env.now() / 3600)
+    if repack_info is not None:
+        extra["incremental_full_repack"] = repack_info["full_repack"]
+        extra["incremental_touched_trays"] = len(repack_info["touched_trays"])
+        extra["incremental_not_placed"] = len(repack_info["not_placed"])
+    stage_timer.close()
+    extra["stage_seconds"] = stage_timer.times
+    # Peak RSS of the worker process (it includes earlier runs of the same worker)
+    extra["peak_rss_mb"] = peak_rss_mb()
+    extra["stage_peak_rss_mb"] = stage_timer.peak_rss
+    if stage_timer.trace_allocations:
+        os.makedirs(os.path.join("main_result_output", config.name), exist_ok=True)
+        allocations_path = os.path.join("main_result_output", config.name, f"allocations_run{run_index}.json")
+        with open(allocations_path, "w") as f:
+            json.dump(stage_timer.allocations, f, indent=2)
+    summary = write_summary(average_picking_time, average_item_time, item_throughput, env.order_count, env.item_count, run_index, extra=extra)
 
     # Show the average pick time
     # print(f"Average pick time: {average_picking_time}")
@@ -882,18 +1720,50 @@ def run_simulation_once(run_index):
     #
     # print("✅ All files were saved")
 
-    return run_index
+    return summary
+
+
+def run_with_config(task):
+    """ Runs one replication of a given configuration, so one pool can serve several scenarios (see the sweep). """
+    config_dict, run_index = task
+    set_config(config_dict)
+    return config_dict["name"], run_simulation_once(run_index)
+
 
 if __name__ == "__main__":
     multiprocessing.set_start_method("spawn")  # Required on Windows
 
-    num_runs = config.AMOUNT_OF_RUNS
+    if len(sys.argv) > 1:
+        config = load_config(sys.argv[1])
 
-    with multiprocessing.Pool() as pool:
-        for _ in tqdm(pool.imap_unordered(run_simulation_once, range(num_runs)), total=num_runs, desc="Simulation progress"):
-            pass
+    # start with empty logging files
+    initialize_result_files()
 
     folder = f"main_result_output/{config.name}"
+    aggregator = RunAggregator(antithetic=getattr(config, "COMMON_RANDOM_NUMBERS", True)
+                                          and getattr(config, "ANTITHETIC_PICKTIMES", False))
+
+    # With TARGET_RELATIVE_HALF_WIDTH, runs continue until the throughput estimate is precise enough (or MAX_RUNS)
+    target = getattr(config, "TARGET_RELATIVE_HALF_WIDTH", None)
+    num_runs = getattr(config, "MAX_RUNS", 1000) if target is not None else config.AMOUNT_OF_RUNS
+    processes = os.cpu_count()
+
+    with SimulationPool(processes, memory_fraction=getattr(config, "MEMORY_FRACTION", 0.8), initializer=set_config,
+                        initargs=(vars(config),)) as pool, tqdm(total=num_runs, desc="Simulation progress") as progress:
+        # Aggregate the results as soon as a run finishes
+        run_info = dispatch_runs(pool, aggregator, num_runs, target=target,
+                                 min_runs=getattr(config, "MIN_RUNS", 10),
+                                 max_seconds=getattr(config, "MAX_WALL_SECONDS", None), progress=progress)
+
+    print(f"Stopped after {run_info['runs']} runs: {run_info['stop_reason']}")
+    aggregate_path = aggregator.write(folder, info=run_info)
+    with open(os.path.join(folder, "config.yaml"), "w") as f:  # next to the aggregate, e.g. for the surrogate model
+        yaml.safe_dump(vars(config), f, sort_keys=False)
+    for metric, result in aggregator.to_dict().items():
+        print(f"{metric}: {result['mean']:.2f} ± {result['half_width']:.2f} (95% CI, n={result['n']})")
+    print(f"Aggregate saved to {aggregate_path}")
+
     merge_and_clean_jsonl_files(folder, "picking_times")
     merge_and_clean_jsonl_files(folder, "handling_times")
+    merge_and_clean_jsonl_files(folder, "order_times")
     merge_and_clean_jsonl_files(folder, "summary")
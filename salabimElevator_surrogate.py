@@ -0,0 +1,301 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import yaml
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+
+from salabimElevator_sweep import build_scenarios, load_yaml
+
+''' =============== Surrogate model of the simulation, trained on sweep results =============== '''
+# A Gaussian process on the configuration parameters predicts a metric (default: throughput_items_per_hour) with an
+# uncertainty, for configurations that were never simulated. Every scenario folder with an aggregate.json and a
+# config.yaml (written by the sweep and by salabimElevator_multiprocessing.py) is one training point. The noise of a
+# point is the variance of its mean (std^2 / n of the runs), so scenarios with few runs count less.
+# Usage:
+#   python salabimElevator_surrogate.py train main_result_output/sweep_warehouse_height [more folders]
+#   python salabimElevator_surrogate.py predict WAREHOUSE_HEIGHT=80 ELEVATOR_RETRIEVE_TIME=4.2
+#   python salabimElevator_surrogate.py suggest --candidates Configurations/sweeps/warehouse_height.yaml --count 5
+# suggest writes a sweep file with the configurations where the model is the most uncertain (to simulate next).
+
+MODEL_PATH = os.path.join("main_result_output", "surrogate.json")
+FEATURES = ["WAREHOUSE_HEIGHT", "TRAYS_PER_ROW", "tray_length", "tray_width", "max_trays", "TRAY_FILLING_MODE",
+            "ELEVATOR_RETRIEVE_TIME", "ELEVATOR_RETURN_TIME", "OPERATOR_LEVEL", "hours"]
+CATEGORICAL_FEATURES = {"TRAY_FILLING_MODE"}
+
+
+def load_training_data(folders, metric="throughput_items_per_hour"):
+    """
+    Returns a list of (config dict, mean, variance of the mean) for every aggregate.json below the given folders.
+    """
+    points = []
+    for folder in folders:
+        for aggregate_path in sorted(glob.glob(os.path.join(folder, "**", "aggregate.json"), recursive=True)):
+            config_path = os.path.join(os.path.dirname(aggregate_path), "config.yaml")
+            if not os.path.exists(config_path):
+                print(f"Skipped {aggregate_path}: no config.yaml next to it")
+                continue
+            with open(aggregate_path) as f:
+                result = json.load(f).get(metric)
+            if not result or result["n"] < 2:
+                continue  # at least 2 runs are needed for the variance of the mean
+            points.append((load_yaml(config_path), result["mean"], result["std"] ** 2 / result["n"]))
+    return points
+
+
+class GaussianProcessSurrogate:
+    """
+    Gaussian process with a squared exponential kernel and one length scale per input (ARD).
+    Numeric parameters are standardized, categorical parameters (TRAY_FILLING_MODE) are one-hot encoded.
+    Parameters that have the same value in every training point are not used as input.
+    """
+    def __init__(self, metric="throughput_items_per_hour"):
+        self.metric = metric
+        self.numeric = []
+        self.categories = {}
+        self.constants = {}
+        self.x_mean = self.x_std = None
+        self.y_mean = self.y_std = 1.0
+        self.log_parameters = None  # log of the length scales, signal std and noise std
+
+    # --- encoding of the configurations ---
+    def choose_features(self, config_dicts):
+        for feature in FEATURES:
+            values = [config_dict.get(feature) for config_dict in config_dicts]
+            if len(set(map(str, values))) == 1:
+                self.constants[feature] = values[0]
+            elif feature in CATEGORICAL_FEATURES:
+                self.categories[feature] = sorted(set(values), key=str)
+            else:
+                self.numeric.append(feature)
+        if not self.numeric and not self.categories:
+            raise ValueError("The training configurations don't differ in any of the FEATURES")
+
+    def encode(self, config_dicts):
+        numeric = np.array([[float(config_dict[feature]) for feature in self.numeric] for config_dict in config_dicts])
+        numeric = numeric.reshape(len(config_dicts), len(self.numeric))
+        if self.x_mean is not None:
+            numeric = (numeric - self.x_mean) / self.x_std
+        one_hot = [
+            [float(config_dict.get(feature) == value) for feature, values in self.categories.items() for value in values]
+            for config_dict in config_dicts
+        ]
+        return np.hstack([numeric, np.array(one_hot).reshape(len(config_dicts), -1)])
+
+    # --- Gaussian process ---
+    def kernel(self, a, b, log_parameters):
+        length_scales = np.exp(log_parameters[:-2])
+        signal_variance = np.exp(2 * log_parameters[-2])
+        distance = (((a[:, None, :] - b[None, :, :]) / length_scales) ** 2).sum(axis=2)
+        return signal_variance * np.exp(-0.5 * distance)
+
+    def covariance(self, log_parameters):
+        noise = np.exp(2 * log_parameters[-1]) + self.noise
+        return self.kernel(self.x, self.x, log_parameters) + np.diag(noise)
+
+    def negative_log_likelihood(self, log_parameters):
+        try:
+            factor = cho_factor(self.covariance(log_parameters), lower=True)
+        except np.linalg.LinAlgError:
+            return 1e10
+        alpha = cho_solve(factor, self.y)
+        return 0.5 * self.y @ alpha + np.log(np.diag(factor[0])).sum() + 0.5 * len(self.y) * np.log(2 * np.pi)
+
+    def fit(self, points, restarts=5, seed=0):
+        """ points: list of (config dict, mean of the metric, variance of that mean). """
+        config_dicts = [config_dict for config_dict, _, _ in points]
+        self.training_configs = [{feature: config_dict.get(feature) for feature in FEATURES}
+                                 for config_dict in config_dicts]
+        self.choose_features(config_dicts)
+        numeric = self.encode(config_dicts)[:, :len(self.numeric)]
+        self.x_mean = numeric.mean(axis=0)
+        self.x_std = numeric.std(axis=0)
+        self.x_std[self.x_std == 0] = 1.0
+        self.x = self.encode(config_dicts)
+
+        y = np.array([mean for _, mean, _ in points])
+        self.y_mean = y.mean()
+        self.y_std = y.std() or 1.0
+        self.y = (y - self.y_mean) / self.y_std
+        self.noise = np.array([variance for _, _, variance in points]) / self.y_std ** 2
+
+        # Maximum likelihood estimate of the hyperparameters, from a few random starting points
+        np_rng = np.random.default_rng(seed)
+        bounds = [(np.log(0.05), np.log(50.0))] * self.x.shape[1] + [(np.log(0.05), np.log(10.0)),
+                                                                     (np.log(1e-4), np.log(1.0))]
+        best = None
+        for _ in range(restarts):
+            start = np.array([np_rng.uniform(low, high) for low, high in bounds])
+            result = minimize(self.negative_log_likelihood, start, method="L-BFGS-B", bounds=bounds)
+            if best is None or result.fun < best.fun:
+                best = result
+        self.log_parameters = best.x
+        self.factorize()
+        return self
+
+    def factorize(self):
+        self.factor = cho_factor(self.covariance(self.log_parameters), lower=True)
+        self.alpha = cho_solve(self.factor, self.y)
+
+    def predict(self, config_dicts):
+        """ Mean and standard deviation of the metric (original units) for every configuration. """
+        x = self.encode(config_dicts)
+        cross = self.kernel(x, self.x, self.log_parameters)
+        mean = cross @ self.alpha
+        variance = np.exp(2 * self.log_parameters[-2]) - (cross * cho_solve(self.factor, cross.T).T).sum(axis=1)
+        return mean * self.y_std + self.y_mean, np.sqrt(np.maximum(variance, 0.0)) * self.y_std
+
+    def leave_one_out(self):
+        """ Leave-one-out predictions of the training points (closed form, no refitting). Returns (mean, std). """
+        inverse_diagonal = np.diag(cho_solve(self.factor, np.eye(len(self.y))))
+        mean = self.y - self.alpha / inverse_diagonal
+        return mean * self.y_std + self.y_mean, np.sqrt(1 / inverse_diagonal) * self.y_std
+
+    def suggest(self, candidates, count):
+        """
+        Picks the candidates with the largest predictive uncertainty, one at a time: a picked candidate is added as a
+        training point (at its predicted mean, with the same hyperparameters) so the next pick is not right next to it.
+        """
+        chosen = []
+        x, y, noise = self.x, self.y, self.noise
+        candidates = list(candidates)
+        for _ in range(min(count, len(candidates))):
+            mean, std = self.predict(candidates)
+            best = int(np.argmax(std))
+            chosen.append((candidates.pop(best), mean[best], std[best]))
+            self.x = np.vstack([self.x, self.encode([chosen[-1][0]])])
+            self.y = np.append(self.y, (mean[best] - self.y_mean) / self.y_std)
+            self.noise = np.append(self.noise, 0.0)
+            self.factorize()
+        self.x, self.y, self.noise = x, y, noise
+        self.factorize()
+        return chosen
+
+    # --- saving ---
+    def to_dict(self):
+        return {
+            "metric": self.metric, "numeric": self.numeric, "categories": self.categories,
+            "constants": self.constants, "x_mean": self.x_mean.tolist(), "x_std": self.x_std.tolist(),
+            "y_mean": self.y_mean, "y_std": self.y_std, "x": self.x.tolist(), "y": self.y.tolist(),
+            "noise": self.noise.tolist(), "log_parameters": self.log_parameters.tolist(),
+            "training_configs": self.training_configs
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(data["metric"])
+        model.numeric, model.categories, model.constants = data["numeric"], data["categories"], data["constants"]
+        model.x_mean, model.x_std = np.array(data["x_mean"]), np.array(data["x_std"])
+        model.y_mean, model.y_std = data["y_mean"], data["y_std"]
+        model.x, model.y, model.noise = np.array(data["x"]), np.array(data["y"]), np.array(data["noise"])
+        model.log_parameters = np.array(data["log_parameters"])
+        model.training_configs = data["training_configs"]
+        model.factorize()
+        return model
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def parse_overrides(assignments):
+    """ ["WAREHOUSE_HEIGHT=80", ...] -> {"WAREHOUSE_HEIGHT": 80, ...} (values are parsed as YAML). """
+    return {key: yaml.safe_load(value) for key, value in (assignment.split("=", 1) for assignment in assignments)}
+
+
+def random_candidates(model, amount, seed=0):
+    """ Configurations drawn uniformly inside the range of the training data (integers stay integers). """
+    np_rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(amount):
+        candidate = dict(model.constants)
+        for feature in model.numeric:
+            values = [config[feature] for config in model.training_configs]
+            low, high = min(values), max(values)
+            if all(isinstance(value, int) for value in values):
+                candidate[feature] = int(np_rng.integers(low, high + 1))
+            else:
+                candidate[feature] = round(float(np_rng.uniform(low, high)), 3)
+        for feature, values in model.categories.items():
+            candidate[feature] = values[np_rng.integers(len(values))]
+        candidates.append(candidate)
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=MODEL_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train")
+    train_parser.add_argument("folders", nargs="+", help="sweep or result folders with aggregate.json files")
+    train_parser.add_argument("--metric", default="throughput_items_per_hour")
+    predict_parser = subparsers.add_parser("predict")
+    predict_parser.add_argument("--base", default="Configurations/base.yaml")
+    predict_parser.add_argument("parameters", nargs="*", help="PARAMETER=value")
+    suggest_parser = subparsers.add_parser("suggest")
+    suggest_parser.add_argument("--base", default="Configurations/base.yaml")
+    suggest_parser.add_argument("--candidates", help="sweep file whose scenarios are the candidates "
+                                                     "(default: random configurations in the training range)")
+    suggest_parser.add_argument("--samples", type=int, default=2000)
+    suggest_parser.add_argument("--count", type=int, default=5)
+    suggest_parser.add_argument("--replications", type=int, default=30)
+    suggest_parser.add_argument("--output", default="Configurations/sweeps/suggested.yaml")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        points = load_training_data(args.folders, args.metric)
+        if len(points) < 3:
+            raise SystemExit(f"Only {len(points)} training point(s) found, at least 3 are needed")
+        model = GaussianProcessSurrogate(args.metric).fit(points)
+        model.save(args.model)
+        loo_mean, loo_std = model.leave_one_out()
+        observed = np.array([mean for _, mean, _ in points])
+        inside = np.abs(loo_mean - observed) <= 1.96 * loo_std
+        print(f"Trained on {len(points)} configurations, inputs: {model.numeric + list(model.categories)}")
+        print(f"Leave-one-out RMSE: {np.sqrt(np.mean((loo_mean - observed) ** 2)):.2f}, "
+              f"observed inside the 95% interval: {inside.mean():.0%}")
+        print(f"Model saved to {args.model}")
+
+    elif args.command == "predict":
+        model = GaussianProcessSurrogate.load(args.model)
+        config_dict = load_yaml(args.base)
+        config_dict.update(parse_overrides(args.parameters))
+        start = time.perf_counter()
+        mean, std = model.predict([config_dict])
+        milliseconds = (time.perf_counter() - start) * 1e3
+        print(f"{model.metric}: {mean[0]:.2f} ± {1.96 * std[0]:.2f} (95%, predicted in {milliseconds:.2f} ms)")
+
+    else:
+        model = GaussianProcessSurrogate.load(args.model)
+        base = load_yaml(args.base)
+        if args.candidates:
+            candidates = [config_dict for _, _, config_dict in build_scenarios(load_yaml(args.candidates))]
+        else:
+            candidates = [dict(base, **candidate) for candidate in random_candidates(model, args.samples)]
+        chosen = model.suggest(candidates, args.count)
+
+        scenarios = []
+        for index, (config_dict, mean, std) in enumerate(chosen):
+            changed = {feature: config_dict[feature] for feature in model.numeric + list(model.categories)}
+            print(f"{changed}: {mean:.2f} ± {1.96 * std:.2f}")
+            scenarios.append(dict(changed, name=f"suggestion{index}"))
+        sweep = {"name": "sweep_suggested", "base": args.base, "replications": args.replications,
+                 "scenarios": scenarios}
+        with open(args.output, "w") as f:
+            f.write("# Configurations where the surrogate model is the most uncertain (salabimElevator_surrogate.py)\n")
+            yaml.safe_dump(sweep, f, sort_keys=False)
+        print(f"Sweep file saved to {args.output}, run it with: python salabimElevator_sweep.py {args.output}")
+
+
+if __name__ == "__main__":
+    main()
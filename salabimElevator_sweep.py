@@ -0,0 +1,143 @@
+import itertools
+import multiprocessing
+import os
+import sys
+
+import pandas as pd
+import yaml
+from tqdm import tqdm
+
+from salabimElevator_multiprocessing import (
+    RunAggregator, SimulationPool, run_with_config, initialize_result_files, merge_and_clean_jsonl_files
+)
+
+''' =============== Parameter sweep over YAML configurations =============== '''
+# Runs every (scenario, replication) pair of a sweep on one shared process pool.
+# Usage: python salabimElevator_sweep.py Configurations/sweeps/<sweep>.yaml
+#
+# A sweep file contains:
+#   name: name of the sweep, results are saved in main_result_output/<name>/<scenario>/
+#   base: YAML file with the default parameters of every scenario
+#   replications: amount of runs per scenario (default: AMOUNT_OF_RUNS of the base)
+#   grid: parameter -> list of values, every combination becomes a scenario (optional)
+#   scenarios: list of YAML files and/or dicts with parameters (optional, a dict can have a "name")
+# When both grid and scenarios are given, the grid is applied on top of every scenario.
+
+
+def load_yaml(filepath):
+    with open(filepath, "r") as f:
+        return yaml.safe_load(f)
+
+
+def format_value(value):
+    return str(value).replace("/", "-").replace(" ", "")
+
+
+def build_scenarios(sweep):
+    """
+    Returns a list of (scenario name, parameters that differ from the base, full configuration dict).
+    """
+    base = load_yaml(sweep["base"])
+
+    variants = []
+    for entry in sweep.get("scenarios") or [{}]:
+        if isinstance(entry, str):
+            overrides = load_yaml(entry)
+            overrides["name"] = os.path.splitext(os.path.basename(entry))[0]
+        else:
+            overrides = dict(entry)
+        variants.append(overrides)
+
+    grid = sweep.get("grid") or {}
+    parameters = list(grid)
+    combinations = list(itertools.product(*(grid[parameter] for parameter in parameters)))
+
+    scenarios = []
+    for overrides in variants:
+        for values in combinations:
+            scenario = dict(overrides)
+            scenario.update(zip(parameters, values))
+
+            name_parts = [overrides["name"]] if "name" in overrides else []
+            name_parts += [f"{parameter}={format_value(value)}" for parameter, value in zip(parameters, values)]
+            scenario_name = "_".join(name_parts) or "base"
+
+            config_dict = dict(base)
+            config_dict.update(scenario)
+            config_dict["name"] = f"{sweep['name']}/{scenario_name}"
+            changed = {key: value for key, value in config_dict.items() if key != "name" and base.get(key) != value}
+            scenarios.append((scenario_name, changed, config_dict))
+
+    names = [name for name, _, _ in scenarios]
+    if len(set(names)) != len(names):
+        raise Exception("\n\nEvery scenario in a sweep needs a unique name\n\n")
+    return scenarios
+
+
+def comparison_table(scenarios, aggregators):
+    """ One row per scenario: the parameters that were changed and mean/CI of every aggregated metric. """
+    changed_parameters = sorted({key for _, changed, _ in scenarios for key in changed})
+    rows = []
+    for scenario_name, changed, config_dict in scenarios:
+        row = {"scenario": scenario_name}
+        for parameter in changed_parameters:
+            row[parameter] = config_dict.get(parameter)
+        for metric, result in aggregators[scenario_name].to_dict().items():
+            row[f"{metric}_mean"] = result["mean"]
+            row[f"{metric}_ci_low"] = result["ci_low"]
+            row[f"{metric}_ci_high"] = result["ci_high"]
+        for name, values in aggregators[scenario_name].latency_percentiles().items():
+            for percentile, value in values.items():
+                row[f"{name}_{percentile}"] = value
+        row["runs"] = aggregators[scenario_name].statistics["throughput_items_per_hour"].n
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_sweep(sweep_path, processes=None):
+    sweep = load_yaml(sweep_path)
+    scenarios = build_scenarios(sweep)
+    base = load_yaml(sweep["base"])
+    replications = sweep.get("replications", base.get("AMOUNT_OF_RUNS", 1))
+    sweep_folder = os.path.join("main_result_output", sweep["name"])
+
+    aggregators = {}
+    for scenario_name, _, config_dict in scenarios:
+        initialize_result_files(config_dict["name"])
+        with open(os.path.join("main_result_output", config_dict["name"], "config.yaml"), "w") as f:
+            yaml.safe_dump(config_dict, f, sort_keys=False)
+        aggregators[scenario_name] = RunAggregator(antithetic=config_dict.get("COMMON_RANDOM_NUMBERS", True)
+                                                             and config_dict.get("ANTITHETIC_PICKTIMES", False))
+
+    # Replication-major order: all scenarios progress together, so partial results are comparable
+    tasks = [(config_dict, run_index) for run_index in range(replications) for _, _, config_dict in scenarios]
+    scenario_by_config_name = {config_dict["name"]: scenario_name for scenario_name, _, config_dict in scenarios}
+
+    # The pool is sized on the memory of the first task (MEMORY_FRACTION of the base file), see SimulationPool
+    with SimulationPool(processes, memory_fraction=base.get("MEMORY_FRACTION", 0.8)) as pool:
+        for config_name, summary in tqdm(pool.imap_unordered(run_with_config, tasks), total=len(tasks),
+                                         desc=f"Sweep {sweep['name']}"):
+            aggregators[scenario_by_config_name[config_name]].add(summary)
+
+    for scenario_name, _, config_dict in scenarios:
+        folder = os.path.join("main_result_output", config_dict["name"])
+        aggregators[scenario_name].write(folder)
+        merge_and_clean_jsonl_files(folder, "picking_times")
+        merge_and_clean_jsonl_files(folder, "handling_times")
+        merge_and_clean_jsonl_files(folder, "order_times")
+        merge_and_clean_jsonl_files(folder, "summary")
+
+    table = comparison_table(scenarios, aggregators)
+    table_path = os.path.join(sweep_folder, "comparison.csv")
+    table.to_csv(table_path, index=False)
+    print(table.to_string(index=False))
+    print(f"Comparison table saved to {table_path}")
+    return table
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")  # Required on Windows
+
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python salabimElevator_sweep.py Configurations/sweeps/<sweep>.yaml")
+    run_sweep(sys.argv[1])
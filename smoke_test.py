@@ -0,0 +1,66 @@
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import yaml
+
+''' =============== Smoke test of the multiprocessing entry point =============== '''
+# Runs "python salabimElevator_multiprocessing.py <config>" end to end on a short version of a configuration (a few runs
+# of 1 hour, stage cache off) and checks that it finishes: exit code 0, an aggregate.json with the metrics and the
+# merged result files, and no *_runN.jsonl files left behind.
+# Usage (from the root of the project):
+#   python smoke_test.py [Configurations/X.yaml]
+#   python -m pytest smoke_test.py
+
+NAME = "smoke_test"
+SMOKE_SETTINGS = {"name": NAME, "hours": 1, "AMOUNT_OF_RUNS": 4, "TARGET_RELATIVE_HALF_WIDTH": None,
+                  "STAGE_CACHE": False, "PROFILE_RUN_INDEX": None, "TRACEMALLOC_RUN_INDEX": None}
+
+
+def run_main(config_path="Configurations/base.yaml"):
+    """ Runs the entry point on a short copy of the configuration. Returns the output folder. """
+    with open(config_path) as f:
+        config_dict = yaml.safe_load(f)
+    config_dict.update(SMOKE_SETTINGS)
+    folder = os.path.join("main_result_output", NAME)
+    shutil.rmtree(folder, ignore_errors=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        smoke_config_path = os.path.join(tmp, f"{NAME}.yaml")
+        with open(smoke_config_path, "w") as f:
+            yaml.safe_dump(config_dict, f, sort_keys=False)
+        process = subprocess.run([sys.executable, "salabimElevator_multiprocessing.py", smoke_config_path],
+                                 capture_output=True, text=True)
+    assert process.returncode == 0, f"The entry point failed:\n{process.stderr[-3000:]}"
+    return folder
+
+
+def check_output(folder):
+    with open(os.path.join(folder, "aggregate.json")) as f:
+        aggregate = json.load(f)
+    assert aggregate["throughput_items_per_hour"]["n"] == SMOKE_SETTINGS["AMOUNT_OF_RUNS"]
+    assert aggregate["run_info"]["runs"] == SMOKE_SETTINGS["AMOUNT_OF_RUNS"]
+    assert os.path.exists(os.path.join(folder, "config.yaml"))
+    for base_filename in ["picking_times", "handling_times", "summary"]:
+        assert os.path.exists(os.path.join(folder, f"{base_filename}.jsonl")), f"{base_filename}.jsonl is missing"
+    leftovers = glob.glob(os.path.join(folder, "*_run*.jsonl"))
+    assert not leftovers, f"Per-run files were not merged: {leftovers}"
+
+
+def test_main_end_to_end():
+    folder = run_main()
+    try:
+        check_output(folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    folder = run_main(*sys.argv[1:])
+    check_output(folder)
+    shutil.rmtree(folder, ignore_errors=True)
+    print("Smoke test passed")